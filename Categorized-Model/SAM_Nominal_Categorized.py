@@ -6,13 +6,19 @@ Created on Thu Mar 12 16:32:58 2020
 @author: willamannering
 """
 import numpy as np
-import random
+import os
+import sys
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #SAM_Common sits next to the model folders
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from SAM_Common.SAM_Encoding import encode_items, encode_batch
+from SAM_Common.SAM_Sampling import ContextSampler, WordCueSampler, UniformStream, make_rng, spawn_rngs
 
 class SAM_Nominal_Categorized:
     
     def __init__(self, ListLength, category_size, t=2, r=4, sam_a = .07, sam_b = .07, 
                  sam_c = .07, sam_d = .02, sam_e = .7, sam_f = .7, sam_g = .7, 
-                 sam_h = .25, sam_i = .005, Kmax = 30, Lmax = 3):
+                 sam_h = .25, sam_i = .005, Kmax = 30, Lmax = 3, dtype = np.float64, rng = None, counters = None, encode = True):
         
         ''' ListLength = number of items in studylist, 
         t = presentation time per word
@@ -28,6 +34,10 @@ class SAM_Nominal_Categorized:
         sam_i = Starting association for words in different categories 
         Kmax = maximum number of retrieval failures before search process is stopped
         Lmax = max number of retrieval attempts using word cues instead of context
+        dtype = float type of context_assoc and word_assoc, np.float32 halves their memory
+        rng = numpy Generator or seed for all of this model's random draws
+        counters = SAM_Instrument.Counters to count this model's sampling attempts in, None to not count
+        encode = encode the study list on construction, batch() sets False and assigns shared associations
         '''
 
         self.ListLength = ListLength
@@ -47,24 +57,25 @@ class SAM_Nominal_Categorized:
         self.Lmax = Lmax
         self.K = 0
         self.L = 0
-        self.context_assoc, self.word_assoc, self.category_list = self.encodeitems()
+        self.dtype = np.dtype(dtype)
+        self.rng = make_rng(rng)
+        self.uniforms = UniformStream(self.rng) #uniform numbers for recall, drawn from rng in blocks
+        self.counters = counters
+        self.item_category = self.categorize_items(self.create_categories()) #category of every item
+        if encode:
+            self.context_assoc, self.word_assoc, self.category_list = self.encodeitems()
+            self.init_samplers()
         
     #method for encoding items
     def create_word_assoc(self):
         
         studyitems = self.create_categories()
         
-        word_assoc = np.zeros((self.ListLength, self.ListLength))
+        same_category = self.item_category[:, None] == self.item_category[None, :] #pairs of items in the same category
         
-        for i in range(self.ListLength):
-            cat_val = np.where(studyitems == i)[0][0] #get category value for studyitem i
-            
-            for j in range(self.ListLength):
-                cat = np.where(studyitems == j)[0][0]
-                if (cat_val == cat): #if item j is in the same category as i
-                    word_assoc[i][j] = round(np.random.normal(2, self.sam_h),4)
-                else: #else if item j is not in the same category as j
-                    word_assoc[i][j] = round(np.random.normal(.05, self.sam_i), 4)
+        word_assoc = np.zeros((self.ListLength, self.ListLength))
+        word_assoc[same_category] = np.round(self.rng.normal(2, self.sam_h, size = same_category.sum()), 4)
+        word_assoc[~same_category] = np.round(self.rng.normal(.05, self.sam_i, size = (~same_category).sum()), 4)
         
         return word_assoc, studyitems
 
@@ -76,65 +87,78 @@ class SAM_Nominal_Categorized:
         return ls.reshape(int(self.ListLength/self.category_size), self.category_size)
     
     
+    def categorize_items(self, studyitems):
+        #category index of every item, row c of studyitems holds the items in category c
+        
+        item_category = np.zeros(self.ListLength, dtype = int)
+        item_category[studyitems] = np.arange(studyitems.shape[0])[:, None]
+        
+        return item_category
+    
     def get_category(self, item):
         #get category of given item
         
-        return np.where(self.category_list == item)[0][0]
+        return self.item_category[item]
     
 
     def encodeitems(self):
-        import itertools
         
-        buffer = []
-        present_order = list(range(self.ListLength))
-        
-        random.shuffle(present_order) #randomize presentation order
-        
-        #initialize context association and word-word association matrices
-        context_assoc = np.zeros((1, self.ListLength))
         word_assoc, studyitems = self.create_word_assoc()
         
-        loops_inbuffer = [0]*self.ListLength #what loops were all items in the buffer?
-        
-        for i in range(self.ListLength):
-            if i >= self.r: #if buffer is full
-                buffer[random.randint(0, self.r-1)] = present_order[i] #randomly replace item in buffer with next item
-                
-            else: #if buffer isn't full
-                buffer.append(present_order[i]) #add next item to buffer
-                
-            
-            to_update = list(itertools.permutations(buffer,2))
-            
-            for i in range(self.t): #presentation time, if t is larger words stay in buffer updating associations for longer
-                for pair in to_update:
-                    word_assoc[pair[0]][pair[1]] = word_assoc[pair[0]][pair[1]]+ (self.sam_b)
-                for j in range(len(buffer)):
-                    word_assoc[buffer[j]][buffer[j]] = word_assoc[buffer[j]][buffer[j]] + (self.sam_c)
-                for j in buffer:
-                    loops_inbuffer[j] += 1
-            
-            word_assoc[word_assoc == 0] = self.sam_d
-            
-            
-        #create context association matrix     
-        context_assoc = np.array([self.sam_a*loops for loops in loops_inbuffer])
-       
+        context_assoc, word_assoc = encode_items(self.ListLength, self.t, self.r, self.sam_a, self.sam_b,
+                                                 self.sam_c, self.sam_d, self.rng, word_assoc = word_assoc,
+                                                 dtype = self.dtype)
     
         return context_assoc, word_assoc, studyitems
     
+    @classmethod
+    def batch(cls, M, ListLength, category_size, rng = None, **kwargs):
+        #encode M models in one call, each model's associations are views into one (M, ListLength) context
+        #array and one (M, ListLength, ListLength) word association tensor. rng is a seed spawned into one
+        #independent stream per model, or a list of M generators
+        
+        models = [cls(ListLength, category_size, rng = g, encode = False, **kwargs) for g in spawn_rngs(rng, M)]
+        if not models:
+            return models
+        
+        initial = np.array([g.create_word_assoc()[0] for g in models]) #starting category similarities per model
+        
+        g = models[0]
+        context_assoc, word_assoc = encode_batch([m.rng for m in models], ListLength, g.t, g.r, g.sam_a, g.sam_b,
+                                                 g.sam_c, g.sam_d, word_assoc = initial, dtype = g.dtype)
+        category_list = g.create_categories()
+        
+        for m in range(M):
+            models[m].context_assoc = context_assoc[m]
+            models[m].word_assoc = word_assoc[m]
+            models[m].category_list = category_list
+            models[m].item_category = g.item_category #one category lookup for the whole batch
+            models[m].init_samplers()
+        
+        return models
+    
+    def init_samplers(self):
+        #build sampling structures over the current associations, update_assoc keeps them in sync afterwards
+        
+        self.context_sampler = ContextSampler(self.context_assoc)
+        self.wordcue_sampler = WordCueSampler(self.context_assoc, self.word_assoc)
+    
     #method for updating association matrix
     def update_assoc(self, sampledTrace,  wordcue = -1):
     
         if wordcue != -1: #if word was used as cue, update strengths between cue and retrieved image
             
             self.context_assoc[sampledTrace] = self.context_assoc[sampledTrace] + self.sam_e
+            self.context_sampler.add(sampledTrace, self.sam_e)
+            self.wordcue_sampler.update(sampledTrace, wordcue, self.sam_e)
             self.word_assoc[sampledTrace][sampledTrace] = self.word_assoc[sampledTrace][sampledTrace] + self.sam_g
             self.word_assoc[wordcue][sampledTrace] = self.word_assoc[wordcue][sampledTrace] + self.sam_f 
             self.word_assoc[sampledTrace][wordcue] = self.word_assoc[sampledTrace][wordcue] + self.sam_f 
         
         else: #if only context was used, update association between image to context and image to itself
             self.context_assoc[sampledTrace] = self.context_assoc[sampledTrace] + self.sam_e
+            self.context_sampler.add(sampledTrace, self.sam_e)
+            self.wordcue_sampler.update(sampledTrace, wordcue, self.sam_e)
             self.word_assoc[sampledTrace][sampledTrace] = self.word_assoc[sampledTrace][sampledTrace] + self.sam_g
 
         
@@ -146,21 +170,26 @@ class SAM_Nominal_Categorized:
         
         response = [] #empty list of free recall responses
           
+        counters = self.counters #None unless instrumenting, see SAM_Instrument
         while(self.K < self.Kmax):
             self.L = 0
     
-            probSamp = [ci/np.sum(self.context_assoc) for ci in list(self.context_assoc)]
-    
-            sampledTrace = np.random.choice(a = list(range(self.ListLength)), size = 1, p = probSamp)[0] #begin free recall by using context as a search cue
+            sampledTrace = self.context_sampler.sample(self.uniforms.random()) #begin free recall by using context as a search cue
+            if counters is not None:
+                counters.context_samples += 1
         
             if (alreadySaid[sampledTrace]):
+                if counters is not None:
+                    counters.already_said += 1
                 self.K += 1
                 
             else: #otherwise, if a new trace was sampled
                     
                 probRecover = 1-np.exp(-self.context_assoc[sampledTrace])
                
-                if (probRecover > np.random.rand(1)[0]):#if recovery is successful, update strength of probe to the recovered memory trace
+                if (probRecover > self.uniforms.random()):#if recovery is successful, update strength of probe to the recovered memory trace
+                    if counters is not None:
+                        counters.recoveries += 1
                     
                     self.update_assoc(sampledTrace)
                     
@@ -173,12 +202,14 @@ class SAM_Nominal_Categorized:
                         
                         previous_sample = sampledTrace
                         
-                        probSamp = (self.context_assoc*self.word_assoc[sampledTrace])/sum(self.context_assoc*self.word_assoc[sampledTrace])
-                        
-                        #randomly choose a trace using calculated probabilities
-                        sampledTrace = np.random.choice(a = list(range(self.ListLength)), size = 1, p = probSamp)[0]
+                        #randomly choose a trace using the cue's cached sampling weights
+                        sampledTrace = self.wordcue_sampler.sample(sampledTrace, self.uniforms.random())
+                        if counters is not None:
+                            counters.wordcue_samples += 1
                         
                         if (alreadySaid[sampledTrace]): #if sampledTrace already said, count this as retrieval failure and start again
+                            if counters is not None:
+                                counters.already_said += 1
                             self.K += 1
                             self.L += 1                     
                             sampledTrace = previous_sample
@@ -187,7 +218,9 @@ class SAM_Nominal_Categorized:
                             
                             probRecover = 1-np.exp((-self.context_assoc[sampledTrace])-self.word_assoc[previous_sample][sampledTrace])
                             
-                            if (probRecover > np.random.rand(1)[0]):#if recovery is successful, update strength of probe to the recovered memory trace
+                            if (probRecover > self.uniforms.random()):#if recovery is successful, update strength of probe to the recovered memory trace
+                                if counters is not None:
+                                    counters.recoveries += 1
                                 self.update_assoc(sampledTrace, wordcue = previous_sample)
                                 alreadySaid[sampledTrace] = True #set this trace to already said
                                 
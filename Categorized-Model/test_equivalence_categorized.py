@@ -0,0 +1,75 @@
+#test_equivalence_categorized
+"""
+Equivalence checks for the fast paths of the categorized model, run with pytest from this folder.
+
+As in Uncategorized-Model/test_equivalence.py the fast paths draw the same random
+numbers as the code they replace, so the checks compare exact results: models
+encoded together by batch() against models encoded one at a time,
+batch_free_recall against free_recall one model at a time and the stacked
+GroupRace against the member by member race, all with the category similarities
+the models start from.
+"""
+import numpy as np
+import pytest
+from GroupRecall_Categorized import group_recall
+from SAM_Common.SAM_Batch import batch_free_recall, batch_group_recall
+from SAM_Common.SAM_Clock import ExponentialClock
+from SAM_Common.SAM_Sampling import spawn_rngs
+from SAM_Group_Categorized import SAM_Group_Categorized
+from SAM_Nominal_Categorized import SAM_Nominal_Categorized
+
+
+@pytest.mark.parametrize('cls', [SAM_Nominal_Categorized, SAM_Group_Categorized])
+@pytest.mark.parametrize('ListLength, category_size', [(30, 6), (90, 15), (12, 3)])
+def test_batch_encoding_matches_single_models(cls, ListLength, category_size):
+    for seed in range(5):
+        batch = cls.batch(4, ListLength, category_size, rng = seed)
+        single = [cls(ListLength, category_size, rng = g) for g in spawn_rngs(seed, 4)]
+
+        for a, b in zip(batch, single):
+            assert np.array_equal(a.context_assoc, b.context_assoc)
+            assert np.array_equal(a.word_assoc, b.word_assoc)
+            assert np.array_equal(a.category_list, b.category_list)
+            assert np.array_equal(a.item_category, b.item_category)
+
+
+@pytest.mark.parametrize('ListLength, category_size', [(30, 6), (90, 15)])
+def test_batch_free_recall_matches_free_recall(ListLength, category_size):
+    for seed in range(15):
+        batch = batch_free_recall(SAM_Nominal_Categorized.batch(6, ListLength, category_size, rng = seed), block_size = 4,
+                                  batch_size = 0)
+        serial = [g.free_recall() for g in SAM_Nominal_Categorized.batch(6, ListLength, category_size, rng = seed)]
+
+        assert [list(map(int, r)) for r in batch] == [list(map(int, r)) for r in serial]
+
+
+def test_batch_free_recall_leaves_models_as_free_recall():
+    #same K and L counters and associations after recall, run_chunk records them
+    batch_models = SAM_Nominal_Categorized.batch(5, 30, 6, rng = 3)
+    serial_models = SAM_Nominal_Categorized.batch(5, 30, 6, rng = 3)
+    batch_free_recall(batch_models, batch_size = 0)
+    for g in serial_models:
+        g.free_recall()
+
+    for a, b in zip(batch_models, serial_models):
+        assert (a.K, a.L) == (b.K, b.L)
+        assert np.array_equal(a.word_assoc, b.word_assoc)
+        assert np.array_equal(a.context_assoc, b.context_assoc)
+
+
+@pytest.mark.parametrize('clock', [None, ExponentialClock()])
+@pytest.mark.parametrize('exclude_recalled', [False, True])
+@pytest.mark.parametrize('group_size', [2, 5])
+def test_group_race_matches_member_loop(clock, exclude_recalled, group_size):
+    #same responses, winners, final K and associations, also with the ties of the default FixedClock
+    for seed in range(10):
+        loop_group = SAM_Group_Categorized.batch(group_size, 30, 6, rng = seed, clock = clock, exclude_recalled = exclude_recalled)
+        race_group = SAM_Group_Categorized.batch(group_size, 30, 6, rng = seed, clock = clock, exclude_recalled = exclude_recalled)
+        loop_winners, race_winners = [], []
+
+        assert group_recall(loop_group, race_size = 10**9, winners = loop_winners) == batch_group_recall(race_group, winners = race_winners)
+        assert loop_winners == race_winners
+        assert [g.K for g in loop_group] == [g.K for g in race_group]
+        for a, b in zip(loop_group, race_group):
+            assert np.array_equal(a.word_assoc, b.word_assoc)
+            assert np.array_equal(a.context_assoc, b.context_assoc)
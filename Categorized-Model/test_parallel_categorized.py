@@ -0,0 +1,28 @@
+#test_parallel_categorized
+"""
+Checks that sweeps of the categorized model give the same results however they
+are run, with pytest from this folder: statistics and parameter sweep cells of
+runs spread over worker processes in blocks of any size are identical, to the
+last bit, to those of the same sweep run serially.
+"""
+import pytest
+from GroupRecall_Categorized import run_group_recall, run_parameter_sweep
+from SAM_Common.SAM_Sweep import SweepConfig, grid_design
+
+
+@pytest.mark.parametrize('chunksize', [None, 1, 7])
+@pytest.mark.parametrize('paired', [False, True])
+def test_parallel_sweep_matches_serial(chunksize, paired):
+    serial = run_group_recall(30, 30, 6, 3, seed = 11, paired = paired)
+    parallel = run_group_recall(30, 30, 6, 3, seed = 11, paired = paired, config = SweepConfig(n_jobs = 2, chunksize = chunksize))
+
+    assert parallel.as_dict(paired = paired) == serial.as_dict(paired = paired)
+
+
+def test_parallel_parameter_sweep_matches_serial():
+    design = grid_design({'category_size': [5, 6], 'Kmax': [15, 30]})
+
+    serial = run_parameter_sweep(design, 12, list_length = 30, seed = 13, n_jobs = 1)
+    parallel = run_parameter_sweep(design, 12, list_length = 30, seed = 13, n_jobs = 2, chunksize = 5)
+
+    assert parallel == serial
@@ -0,0 +1,438 @@
+#SAM_Batch
+"""
+Lockstep simulation of many SAM models at once.
+
+Instead of running free_recall on one model at a time, the association arrays
+and recall state (K and L counters, already recalled items, current word cue)
+of a block of models are stacked and every model that is still recalling takes
+its next sampling attempt in the same array step. Models that have stopped are
+masked out.
+
+Each model still draws from its own generator in the order free_recall would,
+so the responses match running free_recall on every model in turn.
+
+GroupRace does the same for the members of a collaborative group: every round
+of the race advances all members that are still sampling in one array step,
+the winner is the argmin of the members' simulated times, with ties broken by
+a uniform drawn from each tied member's stream, and the rollback of failures
+counted after the winning response is a masked array operation. It gives the
+same group response as GroupRecall.group_recall.
+"""
+import time
+import numpy as np
+from .SAM_Instrument import add_counts
+
+
+class UniformBlocks:
+
+    def __init__(self, streams, size):
+        ''' streams = one UniformStream per model (SAM_Sampling)
+        size = uniform numbers drawn per model at a time
+
+        Draws uniforms for every model in blocks and hands them out in order, so
+        model m sees the same numbers as from calling streams[m].random() repeatedly.
+        '''
+
+        self.streams = streams
+        self.size = size
+        self.block = np.array([stream.draw(size) for stream in streams]).reshape(len(streams), size)
+        self.pos = np.zeros(len(streams), dtype = int)
+
+    def take(self, rows):
+        #next uniform number for each model in rows
+
+        for m in rows[self.pos[rows] >= self.size]: #refill models that used up their block
+            self.block[m] = self.streams[m].draw(self.size)
+            self.pos[m] = 0
+
+        u = self.block[rows, self.pos[rows]]
+        self.pos[rows] += 1
+
+        return u
+
+
+def inverse_cdf(weights, u):
+    #one inverse cdf draw per row of weights, matches searchsorted(cumsum, u*total, side = 'right')
+
+    cumulative = np.cumsum(weights, axis = 1)
+    sampled = (cumulative <= (u*cumulative[:, -1])[:, None]).sum(axis = 1)
+
+    return np.minimum(sampled, weights.shape[1] - 1)
+
+
+def batch_free_recall(models, block_size = 4096, draws = 64, batch_size = 48, batch_length = 120):
+    ''' models = nominal SAM models with the same ListLength, e.g. from SAM_Nominal_*.batch()
+    block_size = number of models advanced in lockstep at a time
+    draws = uniform numbers drawn from a model's generator at a time
+    batch_size = fewest models that are advanced in lockstep, fewer recall one at a time
+    batch_length = longest study list that is advanced in lockstep, longer lists recall one at a time
+
+    returns the free recall response of every model, in order. Models are left with the
+    associations and K/L counters free_recall would have left them with.
+    '''
+
+    #stacking only pays for itself with enough models and short enough lists. Measured against
+    #free_recall one model at a time, the lockstep path breaks even at about 32 models of 30-60
+    #items (3x faster at 800 models), needs about 64 models at 90-120 items and is slower for
+    #any number of models from about 150 items (uncategorized) to 200 items (categorized)
+    if len(models) < batch_size or (models and models[0].ListLength > batch_length):
+        return [g.free_recall() for g in models]
+
+    if models and not isinstance(models[0].word_assoc, np.ndarray): #sparse associations are not stacked
+        return [g.free_recall() for g in models]
+
+    if models: #blocks of long lists are kept to about 2**27 stacked word associations (1GB)
+        block_size = max(1, min(block_size, 2**27//max(1, models[0].ListLength**2)))
+
+    responses = []
+    for start in range(0, len(models), block_size):
+        responses.extend(free_recall_block(models[start:start + block_size], draws))
+
+    return responses
+
+
+def free_recall_block(models, draws):
+    #free recall for a block of models in lockstep
+
+    M = len(models)
+    if M == 0:
+        return []
+
+    ListLength = models[0].ListLength
+
+    context_assoc = np.array([g.context_assoc for g in models]) #stacked in the models' own precision
+    word_assoc = np.array([g.word_assoc for g in models])
+    sam_e = np.array([g.sam_e for g in models])
+    sam_f = np.array([g.sam_f for g in models])
+    sam_g = np.array([g.sam_g for g in models])
+    Kmax = np.array([g.Kmax for g in models])
+    Lmax = np.array([g.Lmax for g in models])
+
+    K = np.array([g.K for g in models])
+    L = np.zeros(M, dtype = int)
+    alreadySaid = np.zeros((M, ListLength), dtype = bool)
+    wordcue = np.zeros(M, dtype = bool) #True while a model is recalling with a word cue
+    cue = np.zeros(M, dtype = int) #current word cue
+    response = [[] for g in models]
+
+    uniforms = UniformBlocks([g.uniforms for g in models], draws)
+
+    counts = None #per model counts for models with counters, see SAM_Instrument
+    if any(g.counters is not None for g in models):
+        counts = {name: np.zeros(M, dtype = int) for name in ('context_samples', 'wordcue_samples', 'already_said', 'recoveries')}
+
+    while True:
+        wordcue &= L < Lmax #word cue recall ends after Lmax failures in a row, context recall resumes
+        rows = np.flatnonzero(wordcue | (K < Kmax))
+        if rows.size == 0:
+            break
+
+        by_word = wordcue[rows]
+        L[rows[~by_word]] = 0
+
+        #sample a trace, using context as the cue or the last recalled word together with context
+        weights = context_assoc[rows]
+        word_rows = rows[by_word]
+        weights[by_word] *= word_assoc[word_rows, cue[word_rows]]
+        sampledTrace = inverse_cdf(weights, uniforms.take(rows))
+        if counts is not None:
+            counts['context_samples'][rows[~by_word]] += 1
+            counts['wordcue_samples'][word_rows] += 1
+
+        #sampled trace already said, count as retrieval failure
+        said = alreadySaid[rows, sampledTrace]
+        failed = rows[said]
+        K[failed] += 1
+        L[failed[wordcue[failed]]] += 1
+        if counts is not None:
+            counts['already_said'][failed] += 1
+
+        #otherwise attempt recovery
+        rows = rows[~said]
+        sampledTrace = sampledTrace[~said]
+        by_word = wordcue[rows]
+        strength = context_assoc[rows, sampledTrace]
+        strength[by_word] += word_assoc[rows[by_word], cue[rows[by_word]], sampledTrace[by_word]]
+        recovered = 1 - np.exp(-strength) > uniforms.take(rows)
+
+        failed = rows[~recovered]
+        K[failed[~wordcue[failed]]] += 1
+        L[failed[wordcue[failed]]] += 1
+
+        #successful recovery, update associations and use the recovered word as the next cue
+        rows = rows[recovered]
+        sampledTrace = sampledTrace[recovered]
+        by_word = wordcue[rows]
+        if counts is not None:
+            counts['recoveries'][rows] += 1
+
+        context_assoc[rows, sampledTrace] += sam_e[rows]
+        word_assoc[rows, sampledTrace, sampledTrace] += sam_g[rows]
+        word_rows = rows[by_word]
+        word_trace = sampledTrace[by_word]
+        word_assoc[word_rows, cue[word_rows], word_trace] += sam_f[word_rows]
+        word_assoc[word_rows, word_trace, cue[word_rows]] += sam_f[word_rows]
+
+        alreadySaid[rows, sampledTrace] = True
+        L[rows] = 0
+        wordcue[rows] = True
+        cue[rows] = sampledTrace
+        for m, trace in zip(rows, sampledTrace):
+            response[m].append(trace)
+
+    if counts is not None:
+        add_counts(models, counts)
+
+    for m, g in enumerate(models): #leave every model as free_recall would
+        g.context_assoc[:] = context_assoc[m]
+        g.word_assoc[:] = word_assoc[m]
+        g.K = int(K[m])
+        g.L = int(L[m])
+        g.init_samplers()
+
+    return response
+
+
+class GroupRace:
+
+    def __init__(self, group, draws = 64, counters = None):
+        ''' group = collaborative SAM models recalling together, e.g. from SAM_Group_*.batch()
+        draws = uniform numbers drawn from a member's generator at a time
+        counters = SAM_Instrument.Counters for the group's rounds and K rollbacks, members count their
+        sampling attempts in their own counters
+
+        Holds the associations and K counters of all members as stacked arrays. Sampling
+        attempts take their costs from each member's clock, clocks with draws = 1 turn one of
+        the member's uniform numbers into the cost so the member's draws stay in order.
+        '''
+
+        self.group = group
+        self.G = len(group)
+
+        self.context_assoc = np.array([g.context_assoc for g in group]) #stacked in the members' own precision
+        self.word_assoc = np.array([g.word_assoc for g in group])
+        self.sam_e = np.array([g.sam_e for g in group])
+        self.sam_f = np.array([g.sam_f for g in group])
+        self.sam_g = np.array([g.sam_g for g in group])
+        self.Kmax = np.array([g.Kmax for g in group])
+        self.Lmax = np.array([g.Lmax for g in group])
+        self.K = np.array([g.K for g in group])
+        self.L = np.array([g.L for g in group])
+
+        self.recalled = np.zeros(group[0].ListLength, dtype = bool) #items recalled by the group, shared by all members
+        for g in group:
+            self.recalled |= g.group_recalled
+        self.exclude = np.array([g.exclude_recalled for g in group])
+
+        self.clocks = [] #distinct clocks, members with equal clocks draw their attempt times together
+        self.clock_of = np.zeros(self.G, dtype = int)
+        for m, g in enumerate(group):
+            same = [type(c) is type(g.clock) and vars(c) == vars(g.clock) for c in self.clocks]
+            if True not in same:
+                same.append(True)
+                self.clocks.append(g.clock)
+            self.clock_of[m] = same.index(True)
+
+        self.uniforms = UniformBlocks([g.uniforms for g in group], draws)
+
+        self.counters = counters
+        self.counts = None #per member counts for members with counters
+        if any(g.counters is not None for g in group):
+            self.counts = {name: np.zeros(self.G, dtype = int) for name in ('context_samples', 'wordcue_samples', 'already_said', 'recoveries')}
+
+    def attempt_times(self, rows):
+        #simulated time of one sampling attempt for every member in rows
+
+        times = np.empty(len(rows))
+        for c, clock in enumerate(self.clocks):
+            mine = self.clock_of[rows] == c
+            if mine.any():
+                u = self.uniforms.take(rows[mine]) if clock.draws else np.zeros(mine.sum())
+                times[mine] = clock.times(u)
+
+        return times
+
+    def race(self, running, cue = -1, count_K = None):
+        ''' running = members taking part in this round
+        cue = word cue, -1 for context recall
+        count_K = members whose failures count towards K, all members if not given
+
+        Every member samples until it recovers an item, context recall stops a member at Kmax
+        and word cue recall after Lmax failures. Returns the simulated time and response of every
+        member (inf and -1 for members without a response) and a (members, attempts) array of failure times,
+        -inf where a member did not fail at that attempt.
+        '''
+
+        count_K = np.ones(self.G, dtype = bool) if count_K is None else count_K
+        elapsed = np.zeros(self.G)
+        time = np.full(self.G, np.inf)
+        response = np.full(self.G, -1)
+        fails = []
+        L = np.zeros(self.G, dtype = int) #failures of each member in this round
+
+        rows = np.flatnonzero(running)
+        while rows.size:
+            elapsed[rows] += self.attempt_times(rows)
+
+            #sample a trace with context, or the word cue together with context, as the cue
+            weights = self.context_assoc[rows]
+            if cue != -1:
+                weights = weights*self.word_assoc[rows, cue]
+            if self.exclude[rows].any(): #recalled items are never sampled by members in exclusion mode
+                weights[self.exclude[rows][:, None] & self.recalled[None, :]] = 0
+            sampledTrace = inverse_cdf(weights, self.uniforms.take(rows))
+
+            #sampled trace already recalled by the group is a failure, otherwise attempt recovery
+            recovered = ~self.recalled[sampledTrace]
+            strength = -self.context_assoc[rows, sampledTrace]
+            if cue != -1:
+                strength = strength - self.word_assoc[rows, cue, sampledTrace]
+            recovered[recovered] = 1 - np.exp(strength[recovered]) > self.uniforms.take(rows[recovered])
+            if self.counts is not None:
+                self.counts['context_samples' if cue == -1 else 'wordcue_samples'][rows] += 1
+                self.counts['already_said'][rows[self.recalled[sampledTrace]]] += 1
+                self.counts['recoveries'][rows[recovered]] += 1
+
+            failed = rows[~recovered]
+            step = np.full(self.G, -np.inf)
+            step[failed] = elapsed[failed]
+            fails.append(step)
+            self.K[failed[count_K[failed]]] += 1
+            L[failed] += 1
+
+            won = rows[recovered]
+            time[won] = elapsed[won]
+            response[won] = sampledTrace[recovered]
+
+            rows = failed[self.K[failed] < self.Kmax[failed]] if cue == -1 else failed[L[failed] < self.Lmax[failed]]
+
+        if cue != -1:
+            self.L[running] = L[running]
+        fails = np.stack(fails, axis = 1) if fails else np.full((self.G, 0), -np.inf)
+
+        return time, response, fails
+
+    def update_assoc(self, rows, sampledTrace, wordcue = -1):
+        #update associations of members in rows with the group's response, as the members' update_assoc
+
+        self.context_assoc[rows, sampledTrace] += self.sam_e[rows]
+        self.word_assoc[rows, sampledTrace, sampledTrace] += self.sam_g[rows]
+        if wordcue != -1:
+            self.word_assoc[rows, wordcue, sampledTrace] += self.sam_f[rows]
+            self.word_assoc[rows, sampledTrace, wordcue] += self.sam_f[rows]
+
+    def break_ties(self, time, fails, response_time, members):
+        #winner among members of a round whose fastest response came at response_time, as GroupRecall.break_ties:
+        #members with an attempt at exactly response_time draw a uniform priority and the success with the lowest
+        #priority wins. returns the winner and the priority of every member, 0 for members that drew none
+
+        priority = np.zeros(self.G)
+        tied = np.flatnonzero(members & ((time == response_time) | (fails == response_time).any(axis = 1)))
+        if tied.size < 2:
+            return tied[0], priority
+
+        priority[tied] = self.uniforms.take(tied)
+        won = tied[time[tied] == response_time]
+
+        return won[np.argmin(priority[won])], priority
+
+    def late_fails(self, fails, response_time, priority, winner):
+        #failures of every member after the winner's response, failures at the response time itself count
+        #for members that drew a higher priority than the winner
+
+        late = (fails > response_time) | ((fails == response_time) & (priority > priority[winner])[:, None])
+
+        return late.sum(axis = 1)
+
+    def context_round(self, accum_fails):
+        #all members recall with context, accum_fails are failure times of the last failed word cue round
+
+        time, response, fails = self.race(self.K < self.Kmax)
+        if (response == -1).all(): #every member reached Kmax without a response
+            return -1, -1
+
+        time = time + np.maximum(accum_fails.max(axis = 1, initial = -np.inf), 0) #start after the failed word cue round
+        fails = np.concatenate([accum_fails, fails], axis = 1)
+        response_time = time.min()
+        winner, priority = self.break_ties(time, fails, response_time, response != -1)
+        fastest_response = response[winner]
+
+        #members that produced a later response take back failures after the fastest response, members
+        #without a response are left alone
+        others = response != -1
+        others[winner] = False
+        rollback = self.late_fails(fails, response_time, priority, winner)[others]
+        self.K[others] -= rollback
+        if self.counters is not None:
+            self.counters.K_rollbacks += int(rollback.sum())
+
+        self.update_assoc(np.flatnonzero(response != -1), fastest_response)
+
+        return fastest_response, winner
+
+    def wordcue_round(self, cue):
+        #all members recall with the last response as cue, members past Kmax keep going without counting failures
+
+        time, response, fails = self.race(self.Lmax > 0, cue, count_K = self.K < self.Kmax)
+
+        response_time = time.min()
+        if response_time == np.inf: #no member produced a response
+            return -1, fails, -1
+        winner, priority = self.break_ties(time, fails, response_time, np.ones(self.G, dtype = bool))
+        fastest_response = response[winner]
+
+        others = np.arange(self.G) != winner
+        rollback = self.late_fails(fails, response_time, priority, winner)[others]
+        self.K[others] -= rollback
+        if self.counters is not None:
+            self.counters.K_rollbacks += int(rollback.sum())
+        self.update_assoc(np.arange(self.G), fastest_response, cue)
+
+        return fastest_response, fails, winner
+
+    def recall(self, winners = None):
+        #collaborative recall until every member reached Kmax, returns the group response
+        #winners = optional list, the member that produced each response is appended to it
+
+        group_response = []
+        accum_fails = np.zeros((self.G, 1)) #failure times of the last failed word cue round
+
+        while (self.K < self.Kmax).any():
+            start = time.perf_counter()
+            current_response, winner = self.context_round(accum_fails)
+            if self.counters is not None:
+                self.counters.add_round('context', start)
+            if current_response == -1:
+                break
+
+            while current_response != -1: #use the last response as cue until a word cue round fails
+                group_response.append(int(current_response))
+                if winners is not None:
+                    winners.append(int(winner))
+                self.recalled[current_response] = True
+                start = time.perf_counter()
+                current_response, accum_fails, winner = self.wordcue_round(current_response)
+                if self.counters is not None:
+                    self.counters.add_round('wordcue', start)
+
+        if self.counts is not None:
+            add_counts(self.group, self.counts)
+
+        for m, g in enumerate(self.group): #leave every member as group_recall would
+            g.context_assoc[:] = self.context_assoc[m]
+            g.word_assoc[:] = self.word_assoc[m]
+            g.K = int(self.K[m])
+            g.L = int(self.L[m])
+            g.group_recalled = self.recalled
+            g.init_samplers()
+
+        return group_response
+
+
+def batch_group_recall(group, draws = 64, winners = None, counters = None):
+    #collaborative recall of one group with all members racing in stacked arrays, see GroupRace
+
+    if not group:
+        return []
+
+    return GroupRace(group, draws, counters).recall(winners)
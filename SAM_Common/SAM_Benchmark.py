@@ -0,0 +1,108 @@
+#SAM_Benchmark
+"""
+Measurement helpers for the benchmark scripts (Benchmark.py in each model folder).
+
+A phase is timed by building its inputs with setup(), which is not timed, and
+then calling run() on them. Every call of setup() uses the same seeds, so every
+repeat, and every commit benchmarked, does the same work. Peak memory is
+measured in one further call traced with tracemalloc, which also sees numpy's
+allocations. Tracing slows down Python code, so the timed calls run untraced.
+
+Results are saved as JSON with the python and numpy versions, the machine and
+the git commit, and compare() matches the phases of two result files.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+
+
+def measure(setup, run, count, repeat = 3):
+    ''' setup = function returning the phase's inputs, not timed
+    run = function doing the work being measured on the inputs
+    count = runs done by one call of run, e.g. models encoded or groups recalled
+    repeat = number of timed calls, the median time is reported
+
+    returns count, seconds per call, runs per second and peak traced memory in bytes
+    '''
+
+    times = []
+    for i in range(repeat):
+        inputs = setup()
+        start = time.perf_counter()
+        run(inputs)
+        times.append(time.perf_counter() - start)
+
+    inputs = setup()
+    tracemalloc.start()
+    run(inputs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = float(np.median(times))
+
+    return {'count': count, 'seconds': seconds, 'runs_per_s': count/seconds, 'peak_bytes': peak}
+
+
+def grid_points(grid):
+    #every combination of the values in grid, a dict of parameter name -> list of values
+
+    points = [{}]
+    for name, values in grid.items():
+        points = [dict(point, **{name: value}) for point in points for value in values]
+
+    return points
+
+
+def environment():
+    #versions, machine and git commit the benchmark ran on
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__)), check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): #not run from a git checkout
+        commit = None
+
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def save_results(path, results):
+    #write results with the environment they were measured in
+
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent = 1)
+
+
+def load_results(path):
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def result_key(result):
+    #model, phase and parameters identifying a measurement across result files
+
+    return result['model'], result['phase'], json.dumps(result['params'], sort_keys = True)
+
+
+def compare(old_path, new_path):
+    #speed and memory of every phase in new relative to old, ratios above 1 mean new is faster or uses more memory
+
+    old = {result_key(r): r for r in load_results(old_path)['results']}
+    rows = []
+
+    for r in load_results(new_path)['results']:
+        key = result_key(r)
+        if key not in old:
+            continue
+        rows.append((key, r['runs_per_s']/old[key]['runs_per_s'], r['peak_bytes']/max(old[key]['peak_bytes'], 1)))
+
+    for (model, phase, params), speed, memory in rows:
+        print('%-26s %-16s %s  speed x%.2f  memory x%.2f' % (model, phase, params, speed, memory))
+
+    return rows
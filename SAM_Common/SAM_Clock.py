@@ -0,0 +1,61 @@
+#SAM_Clock
+"""
+Simulated time for the group recall race.
+
+Group members compete to produce the next response and the member that finishes
+first wins. Instead of timing the race with the wall clock, every sampling
+attempt advances a member's simulated time by the cost returned from its clock,
+so the winner only depends on the number of attempts (and the drawn costs), not
+on how fast the machine running the simulation is. Sampled costs are drawn from
+the uniform stream of the model making the attempt.
+
+A FixedClock puts many attempts of different members at the same simulated
+time. The race engines order such attempts as continuous times would, by a
+uniform each tied member draws from its own stream, so no member is favoured.
+
+Clocks also expose draws (uniform numbers used per attempt) and times(), which
+turns those uniforms into attempt costs for many attempts at once.
+"""
+import numpy as np
+
+
+class FixedClock:
+
+    draws = 0
+
+    def __init__(self, cost = 1.0):
+        ''' cost = simulated time taken by every sampling attempt
+        '''
+
+        self.cost = cost
+
+    def attempt(self, rng):
+        #time taken by one sampling attempt
+
+        return self.cost
+
+    def times(self, u):
+        #time taken by len(u) sampling attempts
+
+        return np.full(len(u), float(self.cost))
+
+
+class ExponentialClock:
+
+    draws = 1
+
+    def __init__(self, cost = 1.0):
+        ''' cost = mean simulated time taken by a sampling attempt, attempt times are exponentially distributed
+        '''
+
+        self.cost = cost
+
+    def attempt(self, rng):
+        #time taken by one sampling attempt, rng is the sampling model's generator or UniformStream
+
+        return self.times(rng.random())
+
+    def times(self, u):
+        #inverse cdf of the exponential distribution for uniform numbers u
+
+        return -self.cost*np.log1p(-u)
@@ -0,0 +1,153 @@
+#SAM_Encoding
+"""
+Shared encoding engine for the SAM models.
+
+Encoding is split in two: the random draws (presentation order and which buffer
+slot each new item replaces, taken from the model's Generator) and the
+deterministic construction of the association matrices from those draws. The construction tracks when every item
+entered and left the rehearsal buffer, so buffer co-residence for all pairs is a
+single array operation instead of a walk over every buffer permutation.
+"""
+import numpy as np
+
+
+def draw_presentation(ListLength, r, rng):
+    #draw presentation order and buffer evictions from the model's generator
+
+    present_order = rng.permutation(ListLength) #randomize presentation order
+
+    evictions = np.zeros(ListLength, dtype=int) #buffer slot replaced at each step, unused until buffer is full
+    if ListLength > r:
+        evictions[r:] = rng.integers(0, r, size = ListLength - r)
+
+    return present_order, evictions
+
+
+def buffer_residence(present_order, evictions, r):
+    ''' present_order = (M, ListLength) presentation order for M models
+    evictions = (M, ListLength) buffer slot replaced at each step once the buffer is full
+    r = short term memory buffer
+
+    returns (enter, leave), the step at which each item entered and left the buffer.
+    Items still in the buffer at the end of the list leave at step ListLength.
+    '''
+
+    M, ListLength = present_order.shape
+    rows = np.arange(M)
+
+    enter = np.zeros((M, ListLength), dtype=int)
+    leave = np.full((M, ListLength), ListLength, dtype=int)
+    buffer = np.full((M, max(r, 1)), -1, dtype=int)
+
+    for i in range(ListLength):
+        item = present_order[:, i]
+        if i >= r: #if buffer is full, the item in the replaced slot leaves the buffer
+            slot = evictions[:, i]
+            leave[rows, buffer[rows, slot]] = i
+        else:
+            slot = np.full(M, i)
+        buffer[rows, slot] = item
+        enter[rows, item] = i
+
+    return enter, leave
+
+
+def coresidence(enter, leave):
+    #number of steps every pair of items spent in the buffer together, diagonal is time each item spent in the buffer
+
+    overlap = np.minimum(leave[:, :, None], leave[:, None, :]) - np.maximum(enter[:, :, None], enter[:, None, :])
+
+    return np.clip(overlap, 0, None)
+
+
+def repeated_add(values, counts, increment):
+    #add increment to each entry counts times, one addition at a time so results match incremental updating exactly
+
+    idx = np.nonzero(counts)
+    vals = values[idx]
+    n = counts[idx]
+    inc = increment[idx]
+
+    for k in range(int(n.max()) if n.size else 0):
+        vals = np.where(n > k, vals + inc, vals)
+
+    values[idx] = vals
+
+    return values
+
+
+def build_associations(present_order, evictions, t, r, sam_a, sam_b, sam_c, sam_d, word_assoc=None):
+    ''' present_order, evictions = (M, ListLength) draws from draw_presentation
+    t, r, sam_a, sam_b, sam_c, sam_d = encoding parameters of the SAM models
+    word_assoc = optional (M, ListLength, ListLength) starting word associations, zeros if not given
+
+    returns context_assoc (M, ListLength) and word_assoc (M, ListLength, ListLength)
+    '''
+
+    M, ListLength = present_order.shape
+    t = int(t)
+
+    enter, leave = buffer_residence(present_order, evictions, r)
+    counts = t*coresidence(enter, leave) #number of presentation loops every pair spent in the buffer together
+
+    if word_assoc is None:
+        word_assoc = np.zeros((M, ListLength, ListLength))
+    initial = np.array(word_assoc, dtype=float)
+
+    #associations still at zero after the first presentation get the residual strength, the only
+    #entry touched by the first presentation is the first item's association with itself
+    word_assoc = np.where(initial == 0, sam_d, initial)
+    if t > 0 and ListLength > 0:
+        first = present_order[:, 0]
+        word_assoc[np.arange(M), first, first] = initial[np.arange(M), first, first]
+
+    increment = np.full((ListLength, ListLength), float(sam_b))
+    np.fill_diagonal(increment, sam_c)
+    word_assoc = repeated_add(word_assoc, counts, np.broadcast_to(increment, counts.shape))
+
+    loops_inbuffer = np.diagonal(counts, axis1=1, axis2=2) #what loops were all items in the buffer?
+    context_assoc = sam_a*loops_inbuffer
+
+    return context_assoc, word_assoc
+
+
+def encode_items(ListLength, t, r, sam_a, sam_b, sam_c, sam_d, rng, word_assoc=None, dtype=float):
+    #encode a single study list, returns context_assoc (ListLength,) and word_assoc (ListLength, ListLength)
+    #associations are built in float64 and returned as dtype
+
+    present_order, evictions = draw_presentation(ListLength, r, rng)
+
+    if word_assoc is not None:
+        word_assoc = word_assoc[None]
+
+    context_assoc, word_assoc = build_associations(present_order[None], evictions[None], t, r,
+                                                   sam_a, sam_b, sam_c, sam_d, word_assoc)
+
+    return context_assoc[0].astype(dtype), word_assoc[0].astype(dtype)
+
+
+def draw_presentation_batch(rngs, ListLength, r):
+    #draw presentation orders and buffer evictions for M models, model m draws from rngs[m]
+
+    draws = [draw_presentation(ListLength, r, rng) for rng in rngs]
+
+    present_order = np.array([d[0] for d in draws], dtype=int).reshape(len(rngs), ListLength)
+    evictions = np.array([d[1] for d in draws], dtype=int).reshape(len(rngs), ListLength)
+
+    return present_order, evictions
+
+
+def encode_batch(rngs, ListLength, t, r, sam_a, sam_b, sam_c, sam_d, word_assoc=None, dtype=float):
+    ''' encode M study lists in one call
+    rngs = one Generator per model, each model's encoding only depends on its own generator
+    word_assoc = optional (M, ListLength, ListLength) starting word associations
+    dtype = float type of the returned arrays, associations are built in float64
+
+    returns context_assoc (M, ListLength) and word_assoc (M, ListLength, ListLength), row m belongs to model m
+    '''
+
+    present_order, evictions = draw_presentation_batch(rngs, ListLength, r)
+
+    context_assoc, word_assoc = build_associations(present_order, evictions, t, r, sam_a, sam_b, sam_c, sam_d, word_assoc)
+
+    return context_assoc.astype(dtype, copy=False), word_assoc.astype(dtype, copy=False)
@@ -0,0 +1,202 @@
+#SAM_Fit
+"""
+Fitting model parameters to observed recall data.
+
+The loss of a parameter setting is the weighted squared error of its mean
+measures (e.g. proportions recalled by individuals, nominal and collaborative
+groups) from the targets, and comes with a standard error of its own (delta
+method). The squared error of a mean of few runs is inflated by its noise, the
+squared standard error, so that is taken off when a partly run candidate is
+compared with a fully run one.
+
+fit searches the parameter space with differential evolution, a derivative-free
+method that keeps a population of candidates and proposes one trial per
+candidate each generation from the differences between other candidates. All
+trials of a generation are evaluated together, so their runs are spread over
+the worker processes. Every candidate is run with the same seed, so all draw
+the same random streams (common random numbers): the difference between two
+candidates comes from their parameters, and the loss changes smoothly with
+them instead of jumping with sampling noise.
+
+Trials are raced: they run in stages of growing numbers of runs, and after each
+stage a trial whose loss is clearly worse than its parent's, by more than z
+standard errors, is stopped. Most trials of a converging search are worse than
+their parents, so most stop after the first stage.
+
+fit_parameters fits a model's parameters by running its driver's blocks (e.g.
+GroupRecall.run_chunk) for every candidate, see SAM_Sweep.run_parameter_sweep.
+"""
+import os
+import numpy as np
+from .SAM_Stats import RunningStats
+from .SAM_Sweep import cell_blocks, hypercube, run_cells, scaled
+
+
+def loss(measures, targets, weights = None, unbiased = False):
+    ''' measures = dict of name -> SAM_Stats.RunningStats of a candidate's runs
+    targets = dict of name -> observed mean, every name must be in measures
+    weights = dict of name -> weight of its squared error, 1 if not given
+    unbiased = take the expected noise off every squared error
+
+    returns the loss and its standard error, inf if a measure has no values
+    '''
+
+    value, variance = 0.0, 0.0
+    for name, target in targets.items():
+        stream = measures[name]
+        if stream.count == 0:
+            return np.inf, 0.0
+        weight = 1 if weights is None else weights.get(name, 1)
+        error = stream.mean - target
+        sem2 = stream.var(1)/stream.count if stream.count > 1 else 0.0
+        value += weight*(error**2 - sem2 if unbiased else error**2)
+        variance += (2*weight*error)**2*sem2
+
+    return float(value), float(np.sqrt(variance))
+
+
+def race(cells, evaluate, targets, stages, references = None, weights = None, z = 2.0):
+    ''' cells = candidates, dicts of parameter values
+    evaluate = function of cells and a range of runs (first, last) returning the measures of each cell's runs
+    stages = increasing run counts, the last is the full evaluation
+    references = loss each cell has to stay within z standard errors of to go on to the next stage, None races none
+
+    returns (loss, standard error, measures, runs) of every cell, for cells that were stopped early from their runs so far
+    '''
+
+    measures = [None]*len(cells)
+    runs = [0]*len(cells)
+    alive = list(range(len(cells)))
+    first = 0
+
+    for last in stages:
+        for i, stage in zip(alive, evaluate([cells[i] for i in alive], first, last)):
+            measures[i] = stage if measures[i] is None else {name: measures[i][name].merge(stream)
+                                                             for name, stream in stage.items()}
+            runs[i] = last
+        first = last
+
+        if references is not None and last < stages[-1]:
+            scored = [(i, loss(measures[i], targets, weights, unbiased = True)) for i in alive]
+            alive = [i for i, (value, se) in scored if value - z*se <= references[i]]
+
+    return [loss(m, targets, weights) + (m, n) for m, n in zip(measures, runs)]
+
+
+def fit(bounds, evaluate, targets, stages, weights = None, fixed = None, population = None, generations = 20,
+        mutation = .7, crossover = .9, z = 2.0, seed = None, tol = 0):
+    ''' bounds = dict of parameter name -> (low, high) searched, int bounds give integer parameters
+    evaluate = function of cells and a range of runs (first, last) returning the measures of each cell's runs
+    targets, weights = observed means and their weights, see loss
+    stages = increasing run counts of a race, the last is the runs of a full evaluation
+    fixed = dict of parameter name -> value of every candidate
+    population = number of candidates, 5 per parameter by default
+    generations = most generations of trials
+    mutation, crossover = differential evolution's F and CR
+    z = standard errors a trial's loss may be above its parent's before it is stopped
+    seed = seed of the search, the simulation's seed is part of evaluate
+    tol = stop once the population's losses are all within tol of the best
+
+    returns the best candidate's parameters, loss and standard error, mean measures, and the runs simulated
+    '''
+
+    rng = np.random.default_rng(seed)
+    population = population or max(4, 5*len(bounds))
+    d = len(bounds)
+    if population < 4:
+        raise ValueError('differential evolution needs a population of at least 4')
+
+    def cells(u):
+        return [dict(fixed or {}, **cell) for cell in scaled(bounds, u)]
+
+    #the first population covers the space evenly and is evaluated in full
+    u = hypercube(population, d, rng)
+    scores = race(cells(u), evaluate, targets, stages, weights = weights)
+    simulated = population*stages[-1]
+
+    for generation in range(generations):
+        trials = np.empty_like(u)
+        for i in range(population):
+            a, b, c = rng.choice([j for j in range(population) if j != i], 3, replace = False)
+            mutant = np.clip(u[a] + mutation*(u[b] - u[c]), 0, np.nextafter(1, 0))
+            cross = rng.random(d) < crossover
+            cross[rng.integers(d)] = True #at least one parameter comes from the mutant
+            trials[i] = np.where(cross, mutant, u[i])
+
+        trial_scores = race(cells(trials), evaluate, targets, stages, [score[0] for score in scores], weights, z)
+        simulated += sum(score[3] for score in trial_scores)
+
+        for i, score in enumerate(trial_scores):
+            if score[3] == stages[-1] and score[0] <= scores[i][0]:
+                u[i], scores[i] = trials[i], score
+
+        losses = [score[0] for score in scores]
+        best = int(np.argmin(losses))
+        print('generation %d: best loss %.6g' % (generation, losses[best]), cells(u[best:best + 1])[0],
+              'trials stopped early: %d of %d' % (sum(score[3] < stages[-1] for score in trial_scores), population))
+        if max(losses) - losses[best] <= tol:
+            break
+
+    best = int(np.argmin([score[0] for score in scores]))
+    value, se, measures, runs = scores[best]
+
+    return {'params': cells(u[best:best + 1])[0], 'loss': value, 'se': se,
+            'means': {name: float(stream.mean) for name, stream in measures.items()}, 'runs': simulated}
+
+
+def cell_measures(results, list_length):
+    #RunningStats of the proportions recalled by individuals, nominal groups and collaborative groups in the results
+    #of a cell's blocks
+    individual = [n for result in results for n in result[0]]
+    runs = np.array([r for result in results for r in result[1]], dtype = float).reshape(-1, 2)
+
+    return {'individual': RunningStats.of(np.divide(individual, list_length)),
+            'nominal': RunningStats.of(runs[:, 0]/list_length), 'collaborative': RunningStats.of(runs[:, 1]/list_length)}
+
+
+def fit_parameters(run_block, task, targets, bounds, numruns = 200, fixed = None, weights = None, seed = None,
+                   n_jobs = None, stages = None, measures = None, **search):
+    ''' run_block = function running one block of runs in a worker, e.g. GroupRecall.run_chunk
+    task = the model's RunTask, candidates override its fields and params (see SAM_Sweep.cell_blocks)
+    targets = dict of observed means of measures, e.g. proportions recalled by 'individual', 'nominal' and
+    'collaborative' groups
+    bounds = dict of model parameter -> (low, high) searched
+    numruns = runs of a full evaluation of a candidate
+    fixed = values of other parameters held by every candidate
+    weights = weights of the targets' squared errors, see loss
+    seed = seed of every candidate's runs and of the search
+    n_jobs = worker processes shared by each stage's runs of all candidates, every core by default
+    stages = increasing run counts of the race, numruns/8, /4, /2 and numruns by default
+    measures = function of a cell's block results and its task returning the RunningStats of every target,
+    cell_measures by default
+    search = population, generations, mutation, crossover, z and tol of fit
+
+    every candidate runs from the same seed, so candidates are compared on common random numbers. returns the
+    best parameters, their loss and mean measures, and the runs simulated
+    '''
+
+    sweep_seed = np.random.SeedSequence(seed)
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    stages = sorted(set(max(1, numruns >> k) for k in (3, 2, 1, 0))) if stages is None else stages
+    task = task._replace(seed = sweep_seed.entropy)
+    if measures is None:
+        measures = lambda results, task: cell_measures(results, task.list_length)
+
+    def evaluate(cells, first, last):
+        #measures of runs first to last of every cell
+        chunksize = max(1, min(1000, -(-(last - first)*len(cells)//(4*n_jobs))))
+
+        def blocks(cell):
+            return cell_blocks(cell, task, numruns, chunksize, numruns, first, last)
+
+        def finish(cell, tasks, results):
+            return {'measures': measures(results, tasks[0])}
+
+        return [row['measures'] for row in run_cells(cells, blocks, run_block, finish, n_jobs)]
+
+    result = fit(bounds, evaluate, targets, stages, weights, fixed,
+                 seed = np.random.SeedSequence(sweep_seed.entropy, spawn_key = (3,)), **search)
+    print('best parameters: ', result['params'], 'loss: ', result['loss'], 'means: ', result['means'])
+    print('runs simulated: ', result['runs'], 'seed: ', sweep_seed.entropy)
+
+    return result
@@ -0,0 +1,131 @@
+#SAM_Instrument
+"""
+Optional counters and phase timers for the simulation's hot paths.
+
+Every SAM model has a counters attribute that is None unless instrumenting.
+The model's sampling loops test it once per attempt, so leaving
+instrumentation off costs one comparison. The lockstep paths (SAM_Batch free
+recall and GroupRace) count per model in arrays and add the totals
+to each model's counters when they finish.
+
+Counts that belong to a whole group (rounds, K rollbacks and round times) go
+to the counters passed to GroupRecall.group_recall instead. Counters can be
+shared: GroupRecall.run_chunk gives all models of a run and its group recall
+one Counters, so a run's counts are summed over its nominal and collaborative
+members. summary() aggregates the Counters of many runs.
+
+context_samples     traces sampled with context as the cue
+wordcue_samples     traces sampled with a word cue
+already_said        sampled traces rejected because they were already recalled
+recoveries          sampled traces recovered, including those of members that lost the group race
+failed_recoveries   sampled traces that were not recovered, derived from the counts above
+K_rollbacks         failures taken back from members because another member responded first
+context_rounds      context rounds of the group race
+wordcue_rounds      word cue rounds of the group race
+"""
+import time
+import numpy as np
+
+COUNTS = ('context_samples', 'wordcue_samples', 'already_said', 'recoveries', 'K_rollbacks',
+          'context_rounds', 'wordcue_rounds')
+
+
+class Counters:
+
+    def __init__(self):
+        ''' Counts of every name in COUNTS, plus times, the seconds spent in each timed phase.
+        '''
+
+        for name in COUNTS:
+            setattr(self, name, 0)
+        self.times = {}
+
+    @property
+    def failed_recoveries(self):
+        #every sample is either rejected, recovered or failed to be recovered
+
+        return self.context_samples + self.wordcue_samples - self.already_said - self.recoveries
+
+    def add(self, name, n):
+
+        setattr(self, name, getattr(self, name) + int(n))
+
+    def add_time(self, phase, start):
+        #add the time since start, a time.perf_counter() reading, to phase
+
+        self.times[phase] = self.times.get(phase, 0.0) + time.perf_counter() - start
+
+    def add_round(self, kind, start):
+        #count a 'context' or 'wordcue' round of the group race that started at start, and time it
+
+        self.add(kind + '_rounds', 1)
+        self.add_time(kind + '_round', start)
+
+    def merge(self, other):
+        #add the counts and times of other
+
+        for name in COUNTS:
+            self.add(name, getattr(other, name))
+        for phase, seconds in other.times.items():
+            self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+        return self
+
+    def as_dict(self):
+
+        counts = {name: getattr(self, name) for name in COUNTS}
+        counts['failed_recoveries'] = self.failed_recoveries
+
+        return dict(counts, times = dict(self.times))
+
+
+def add_counts(models, counts):
+    #add per model counts, a dict of name -> array with one entry per model, to every model's counters
+
+    for m, g in enumerate(models):
+        if g.counters is not None:
+            for name, values in counts.items():
+                g.counters.add(name, values[m])
+
+
+def run_statistics(values):
+    #mean, standard deviation and maximum over runs, nan if no run has the value
+
+    values = np.array(values, dtype = float)
+    if values.size == 0:
+        return {'mean': np.nan, 'std': np.nan, 'max': np.nan}
+
+    return {'mean': values.mean(), 'std': values.std(), 'max': values.max()}
+
+
+def summary(runs, sweep = None):
+    ''' runs = Counters of every run
+    sweep = Counters with the sweep's totals, e.g. including baseline models and block phases that belong
+    to no single run. The runs' counts are summed if not given.
+
+    returns {name: {'total', 'mean', 'std', 'max'}}, totals over the sweep and statistics per run, for every
+    count and every timed phase (named time_<phase>). Phases timed per block, not per run, have nan run statistics.
+    '''
+
+    if sweep is None:
+        sweep = Counters()
+        for counters in runs:
+            sweep.merge(counters)
+
+    rows = {}
+    for name in list(COUNTS) + ['failed_recoveries']:
+        rows[name] = dict(total = getattr(sweep, name), **run_statistics([getattr(counters, name) for counters in runs]))
+
+    for phase in sorted(set(phase for counters in runs for phase in counters.times) | set(sweep.times)):
+        rows['time_' + phase] = dict(total = sweep.times.get(phase, 0.0),
+                                     **run_statistics([counters.times[phase] for counters in runs if phase in counters.times]))
+
+    return rows
+
+
+def report(runs, sweep = None):
+    #print summary(runs, sweep) as a table
+
+    print('%-24s %14s %12s %12s %12s' % ('', 'sweep total', 'run mean', 'run std', 'run max'))
+    for name, row in summary(runs, sweep).items():
+        print('%-24s %14.6g %12.6g %12.6g %12.6g' % (name, row['total'], row['mean'], row['std'], row['max']))
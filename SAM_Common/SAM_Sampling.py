@@ -0,0 +1,203 @@
+#SAM_Sampling
+"""
+Sampling structures for the SAM recall loops.
+
+Recall samples memory traces with probability proportional to their association
+strength with the current cue. These structures are kept up to date by the
+models' update_assoc so a draw does not have to renormalize the whole
+association vector every time.
+
+Every model draws from its own numpy Generator. make_rng and spawn_rngs turn a
+seed into generators, spawning independent streams through SeedSequence so runs
+and group members never share random state. During recall a model takes its
+uniform numbers from a UniformStream, which draws them from the generator in
+blocks instead of one call per number.
+"""
+import numpy as np
+
+
+def make_rng(rng = None):
+    #numpy Generator from None, a seed, a SeedSequence or an existing Generator
+
+    if isinstance(rng, np.random.Generator):
+        return rng
+
+    return np.random.default_rng(rng)
+
+
+def spawn_rngs(rng, n):
+    #n independent Generators derived from rng, a list of n Generators is returned as is
+
+    if isinstance(rng, (list, tuple)):
+        if len(rng) != n:
+            raise ValueError('expected %d generators, got %d' % (n, len(rng)))
+        return [make_rng(g) for g in rng]
+
+    if isinstance(rng, np.random.Generator):
+        return rng.spawn(n)
+
+    if not isinstance(rng, np.random.SeedSequence):
+        rng = np.random.SeedSequence(rng)
+
+    return [np.random.default_rng(s) for s in rng.spawn(n)]
+
+
+class UniformStream:
+
+    def __init__(self, rng, size = 1024):
+        ''' rng = the model's Generator
+        size = uniform numbers drawn from the generator at a time
+
+        Hands out the generator's uniform numbers in the order repeated rng.random() calls would.
+        random() stands in for the generator wherever one uniform number is drawn, e.g. a clock's
+        attempt(). No block is drawn before the first number is asked for, so encoding draws from
+        the generator first as before.
+        '''
+
+        self.rng = rng
+        self.size = size
+        self.block = []
+        self.pos = 0
+
+    def random(self):
+        #next uniform number in [0, 1)
+
+        if self.pos == len(self.block):
+            self.block = self.rng.random(self.size).tolist()
+            self.pos = 0
+
+        self.pos += 1
+
+        return self.block[self.pos - 1]
+
+    def draw(self, n):
+        #next n uniform numbers as an array, e.g. a block for the batched engines
+
+        rest = self.block[self.pos:self.pos + n]
+        self.pos += len(rest)
+
+        if len(rest) == n:
+            return np.array(rest)
+
+        return np.concatenate([rest, self.rng.random(n - len(rest))])
+
+
+class ContextSampler:
+
+    def __init__(self, weights):
+        ''' weights = association strengths to sample from, e.g. context_assoc
+
+        Weights are kept in a Fenwick tree, so changing one weight and drawing a
+        sample both take O(log ListLength). Excluded items are given zero weight.
+        '''
+
+        self.n = len(weights)
+        self.tree = [0.0]*(self.n + 1)
+        self.total = 0.0
+
+        for i in range(self.n): #build the tree in O(n) by pushing each node's sum to its parent
+            self.tree[i + 1] += float(weights[i])
+            self.total += float(weights[i])
+            parent = (i + 1) + ((i + 1) & -(i + 1))
+            if parent <= self.n:
+                self.tree[parent] += self.tree[i + 1]
+
+        self.top = 1 #largest power of two no bigger than n, starting step of the tree descent
+        while self.top*2 <= self.n:
+            self.top *= 2
+
+        self.weights = [float(w) for w in weights]
+        self.excluded = [False]*self.n
+        self.n_excluded = 0
+
+    def update_tree(self, item, delta):
+        #add delta to item's entry in the tree
+
+        self.total += delta
+        i = item + 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def add(self, item, delta):
+        #add delta to the weight of item, excluded items keep zero weight in the tree
+
+        self.weights[item] += delta
+        if not self.excluded[item]:
+            self.update_tree(item, delta)
+
+    def exclude(self, item):
+        #remove item from sampling, used when items already recalled should never be sampled
+
+        if self.excluded[item]:
+            return
+
+        self.excluded[item] = True
+        self.n_excluded += 1
+        self.update_tree(item, -self.weights[item])
+
+        if self.n_excluded == self.n: #nothing left to sample, any draw lands on an excluded item
+            self.total = 0.0
+
+    def sample(self, u):
+        #inverse cdf draw, u is a uniform number in [0, 1)
+
+        target = u*self.total
+        pos = 0
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= target: #whole block lies below target, move past it
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+
+        return min(pos, self.n - 1)
+
+
+class WordCueSampler:
+
+    def __init__(self, context_assoc, word_assoc):
+        ''' context_assoc, word_assoc = the model's association arrays, read when a cue's weights are built
+
+        Sampling with a word cue draws trace j with weight context_assoc[j]*word_assoc[cue][j].
+        The last cue's cumulative weights are cached, so repeated cueing from the same word, e.g. the
+        failures of a word cue recall, is a single binary search. update() and exclude() mark the
+        cached row stale and a stale row is built again from scratch when it is next used, so a draw
+        always sees the same cumulative sum as a fresh np.cumsum (SAM_Batch.inverse_cdf). Any update
+        makes every cue's row stale, so only one row is kept and the cache takes O(ListLength) memory,
+        also for sparse word associations.
+        '''
+
+        self.context_assoc = context_assoc
+        self.word_assoc = word_assoc
+        self.n = len(context_assoc)
+        self.row = None #(cue, version of the associations, cumulative weights) of the last cue
+        self.version = 0 #number of association updates and exclusions so far
+        self.excluded = np.zeros(self.n, dtype = bool)
+
+    def sample(self, cue, u):
+        #inverse cdf draw from the cue's weights, u is a uniform number in [0, 1)
+
+        if self.row is None or self.row[0] != cue or self.row[1] != self.version: #another cue, or the associations changed
+            weights = self.context_assoc*self.word_assoc[cue]
+            if self.excluded.any():
+                weights[self.excluded] = 0
+            self.row = (cue, self.version, np.cumsum(weights))
+
+        cumulative = self.row[2]
+
+        return min(int(cumulative.searchsorted(u*cumulative[-1], side = 'right')), self.n - 1)
+
+    def update(self, sampledTrace, wordcue, context_delta):
+        #called from update_assoc, after context_assoc[sampledTrace] grew by context_delta and the sampled
+        #and cue rows of word_assoc changed
+
+        self.version += 1
+
+    def exclude(self, item):
+        #remove item from sampling for every cue
+
+        if not self.excluded[item]:
+            self.excluded[item] = True
+            self.version += 1
@@ -0,0 +1,213 @@
+#SAM_Stats
+"""
+Streaming summary statistics for sweeps of many runs.
+
+RunningStats keeps the count, mean and sum of squared deviations of a stream
+of values (Welford's method), so memory does not grow with the number of runs.
+Two RunningStats, e.g. from blocks run by different worker processes, merge
+into the statistics of both streams together. Reservoir keeps a uniform random
+sample of fixed size from a stream, and merges the same way.
+
+ttest_ind and ttest_rel compute the t-tests of scipy.stats from running
+statistics. SweepSummary holds the statistics a group recall sweep reports,
+added one run at a time in run order so they do not depend on how the sweep
+was split into blocks.
+"""
+from collections import namedtuple
+import numpy as np
+from scipy import stats
+
+TtestResult = namedtuple('TtestResult', ['statistic', 'pvalue', 'df'])
+
+
+class RunningStats:
+
+    def __init__(self):
+        ''' count, mean and M2 (sum of squared deviations from the mean) of the values added so far
+        '''
+
+        self.count = 0
+        self.mean = np.float64(0)
+        self.M2 = np.float64(0)
+
+    @classmethod
+    def of(cls, values):
+        #statistics of an array of values
+
+        values = np.asarray(values, dtype = np.float64)
+        s = cls()
+        if values.size:
+            s.count = values.size
+            s.mean = values.mean()
+            s.M2 = ((values - s.mean)**2).sum()
+
+        return s
+
+    def add(self, x):
+
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.M2 += delta*(x - self.mean)
+
+    def merge(self, other):
+        #statistics of the values of both self and other
+
+        count = self.count + other.count
+        if other.count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta*other.count/count
+        self.M2 = self.M2 + other.M2 + delta**2*self.count*other.count/count
+        self.count = count
+
+        return self
+
+    def var(self, ddof = 0):
+
+        return self.M2/(self.count - ddof) if self.count > ddof else np.float64(np.nan)
+
+    def std(self, ddof = 0):
+
+        return np.sqrt(self.var(ddof))
+
+    def sem(self):
+        #standard error of the mean, as scipy.stats.sem
+
+        return np.sqrt(self.var(1)/self.count) if self.count > 1 else np.float64(np.nan)
+
+
+class Reservoir:
+
+    def __init__(self, size, rng = None):
+        ''' size = largest number of values kept
+        rng = numpy Generator or seed choosing which values are kept
+        '''
+
+        self.size = size
+        self.rng = np.random.default_rng(rng)
+        self.count = 0 #values seen
+        self.sample = []
+
+    def add(self, x):
+        #keep x with probability size/count, replacing a random kept value (algorithm R)
+
+        self.count += 1
+        if len(self.sample) < self.size:
+            self.sample.append(x)
+        else:
+            j = self.rng.integers(self.count)
+            if j < self.size:
+                self.sample[j] = x
+
+    def merge(self, other):
+        #uniform sample of the values seen by both reservoirs
+
+        mine, theirs = list(self.sample), list(other.sample)
+        self.rng.shuffle(mine)
+        self.rng.shuffle(theirs)
+
+        left_mine, left_theirs = self.count, other.count #values of each stream not yet drawn
+        sample = []
+        while len(sample) < min(self.size, self.count + other.count):
+            if self.rng.random()*(left_mine + left_theirs) < left_mine:
+                sample.append(mine.pop())
+                left_mine -= 1
+            else:
+                sample.append(theirs.pop())
+                left_theirs -= 1
+
+        self.sample = sample
+        self.count += other.count
+
+        return self
+
+
+def ttest_ind(a, b):
+    #two-sample t-test with pooled variance of the values behind RunningStats a and b, as scipy.stats.ttest_ind
+
+    df = a.count + b.count - 2
+    pooled = ((a.count - 1)*a.var(1) + (b.count - 1)*b.var(1))/df
+    statistic = (a.mean - b.mean)/np.sqrt(pooled*(1/a.count + 1/b.count))
+
+    return TtestResult(statistic, 2*stats.t.sf(np.abs(statistic), df), np.float64(df))
+
+
+def ttest_rel(difference):
+    #paired t-test from the RunningStats of the paired differences, as scipy.stats.ttest_rel
+
+    df = difference.count - 1
+    statistic = difference.mean/difference.sem()
+
+    return TtestResult(statistic, 2*stats.t.sf(np.abs(statistic), df), np.int64(df))
+
+
+class SweepSummary:
+
+    def __init__(self, reservoir = 0, rng = None):
+        ''' reservoir = number of runs to keep a uniform random sample of, as (run, nominal length, collaborative length)
+        rng = numpy Generator or seed for the reservoir
+        '''
+
+        self.individual = RunningStats() #individual recall lengths
+        self.nominal = RunningStats() #nominal group recall lengths
+        self.collaborative = RunningStats() #collaborative group recall lengths
+        self.difference = RunningStats() #nominal - collaborative length of every run
+        self.runs = Reservoir(reservoir, rng)
+
+    def add_block(self, start, individual, results):
+        ''' start = number of the block's first run
+        individual = individual recall lengths of the block
+        results = (nominal length, collaborative length) of every run of the block
+
+        values are added one run at a time, so blocks added in run order give the same statistics, to the last bit,
+        however the runs were split into blocks
+        '''
+
+        for length in individual:
+            self.individual.add(length)
+
+        for i, (nominal_length, collab_length) in enumerate(results):
+            self.nominal.add(nominal_length)
+            self.collaborative.add(collab_length)
+            self.difference.add(nominal_length - collab_length)
+            if self.runs.size:
+                self.runs.add((start + i, int(nominal_length), int(collab_length)))
+
+    def merge(self, other):
+        #statistics of the runs of both summaries
+
+        self.individual.merge(other.individual)
+        self.nominal.merge(other.nominal)
+        self.collaborative.merge(other.collaborative)
+        self.difference.merge(other.difference)
+        self.runs.merge(other.runs)
+
+        return self
+
+    def ttest(self, paired = False):
+        #t-test of nominal against collaborative recall lengths, paired for runs with common random numbers
+
+        return ttest_rel(self.difference) if paired else ttest_ind(self.nominal, self.collaborative)
+
+    def as_dict(self, scale = 1, paired = False):
+        ''' scale = divisor of the means, standard deviations and standard errors, e.g. list length for proportions recalled
+        paired = report the paired t-test
+
+        returns the summary as a JSON serializable dict
+        '''
+
+        row = {'runs': self.nominal.count, 'individual_runs': self.individual.count}
+        for name in ('individual', 'nominal', 'collaborative', 'difference'):
+            stream = getattr(self, name)
+            row[name] = {'mean': float(stream.mean/scale), 'std': float(stream.std()/scale), 'sem': float(stream.sem()/scale)}
+        test = self.ttest(paired) if self.nominal.count > 1 else TtestResult(np.nan, np.nan, np.nan)
+        row['ttest'] = {'statistic': float(test.statistic), 'pvalue': float(test.pvalue), 'df': float(test.df),
+                        'paired': paired}
+
+        return row
+
+    def __repr__(self):
+
+        return 'SweepSummary(runs = %d, individual = %g, nominal = %g, collaborative = %g)' % (
+            self.nominal.count, self.individual.mean, self.nominal.mean, self.collaborative.mean)
@@ -0,0 +1,248 @@
+#SAM_Store
+"""
+On-disk store for the runs of a group recall sweep.
+
+Records are buffered and written out in chunks of chunk_size runs, one numpy
+.npz file per chunk, so a long sweep never holds more than one chunk of records
+in memory. Each chunk is columnar: a column of lists (e.g. every run's
+collaborative response) is stored as one flat array of values plus an array of
+offsets, row i being values[offsets[i]:offsets[i + 1]]. meta.json records the
+sweep's settings and the number of chunks.
+
+A run record holds the run number, every nominal member's response, the
+collaborative response in the order it was produced, the member that won each
+collaborative response and the final K and L of every member. Individual
+baseline records hold the model's response and its final K and L.
+
+Checkpoint keeps the finished blocks of a sweep in a JSON lines file, so a
+sweep that was stopped can be restarted and skip them. Every run's random
+streams are derived from the sweep's seed and the run number, so the seed
+recorded in the checkpoint is all the random state a restarted sweep needs.
+"""
+import json
+import os
+import numpy as np
+
+
+def ragged(rows):
+    #flat values and offsets of a list of lists
+
+    offsets = np.zeros(len(rows) + 1, dtype = np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+    values = np.array([v for row in rows for v in row], dtype = np.int32)
+
+    return values, offsets
+
+
+def unragged(values, offsets):
+    #list of lists from flat values and offsets
+
+    return [values[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+
+
+class ResultStore:
+
+    def __init__(self, path, group_size, chunk_size = 1000, meta = None, state = None):
+        ''' path = directory the store is written to, created if needed
+        group_size = members per group, every run record has this many nominal and collaborative members
+        chunk_size = run records per chunk file
+        meta = settings of the sweep to save with the records, must be JSON serializable
+        state = state() of a store that was stopped, writing continues after its last chunk
+
+        Use as a context manager, or call close() to write the last chunk and meta.json.
+        '''
+
+        self.path = path
+        self.group_size = group_size
+        self.chunk_size = chunk_size
+        self.meta = dict(meta or {}, group_size = group_size, chunk_size = chunk_size)
+        self.n_chunks = 0
+        self.n_runs = 0
+        self.n_individual = 0
+        if state is not None:
+            self.n_chunks, self.n_runs, self.n_individual = state['n_chunks'], state['n_runs'], state['n_individual']
+        self.runs = []
+        self.individual = []
+
+        os.makedirs(path, exist_ok = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_individual(self, index, response, K, L):
+        #record individual baseline model number index
+
+        self.individual.append((index, response, K, L))
+        if len(self.individual) >= self.chunk_size:
+            self.flush()
+
+    def add_run(self, run, nominal_responses, nominal_KL, group_response, winners, collab_KL):
+        ''' run = run number within the sweep
+        nominal_responses = response of every nominal member
+        nominal_KL, collab_KL = (K, L) of every nominal and collaborative member after recall
+        group_response, winners = collaborative response and the member that produced each item
+        '''
+
+        self.runs.append((run, nominal_responses, nominal_KL, group_response, winners, collab_KL))
+        if len(self.runs) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        #write buffered records to the next chunk file
+
+        if not self.runs and not self.individual:
+            return
+
+        columns = {}
+
+        runs = self.runs
+        columns['run'] = np.array([r[0] for r in runs], dtype = np.int64)
+        columns['nominal'], columns['nominal_offsets'] = ragged([m for r in runs for m in r[1]])
+        columns['nominal_KL'] = np.array([r[2] for r in runs], dtype = np.int32).reshape(len(runs), self.group_size, 2)
+        columns['collaborative'], columns['collaborative_offsets'] = ragged([r[3] for r in runs])
+        columns['winner'] = ragged([r[4] for r in runs])[0]
+        columns['collab_KL'] = np.array([r[5] for r in runs], dtype = np.int32).reshape(len(runs), self.group_size, 2)
+
+        individual = self.individual
+        columns['individual_run'] = np.array([r[0] for r in individual], dtype = np.int64)
+        columns['individual'], columns['individual_offsets'] = ragged([r[1] for r in individual])
+        columns['individual_KL'] = np.array([r[2:] for r in individual], dtype = np.int32).reshape(len(individual), 2)
+
+        np.savez(os.path.join(self.path, 'chunk_%05d.npz' % self.n_chunks), **columns)
+
+        self.n_chunks += 1
+        self.n_runs += len(runs)
+        self.n_individual += len(individual)
+        self.runs = []
+        self.individual = []
+
+    def state(self):
+        #number of chunks and records written so far, call flush() first to include buffered records
+
+        return {'n_chunks': self.n_chunks, 'n_runs': self.n_runs, 'n_individual': self.n_individual}
+
+    def close(self):
+        #write the last chunk and the store's metadata
+
+        self.flush()
+
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(dict(self.meta, **self.state()), f, indent = 1)
+
+
+class Checkpoint:
+
+    def __init__(self, path):
+        ''' path = checkpoint file, read if it exists
+
+        The first line of the file holds the sweep's settings, every further line one finished
+        block. A line cut short by a crash is ignored and cut from the file, that block is simply run again.
+        '''
+
+        self.path = path
+        self.settings = None
+        self.done = {} #block start -> [individual lengths, (nominal length, collaborative length) per run]
+        self.store = None #state of the result store after the last finished block
+
+        if os.path.exists(path):
+            end = 0 #end of the last complete line
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: #unfinished last line
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    end += len(line)
+                    if self.settings is None:
+                        self.settings = entry
+                    else:
+                        self.done[entry['start']] = [entry['individual'], entry['results']]
+                        self.store = entry['store']
+
+            if end < os.path.getsize(path): #cut the unfinished line, so blocks saved from now on start a line
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+
+    def begin(self, settings):
+        #check the checkpoint belongs to this sweep, a new checkpoint starts with its settings
+
+        settings = json.loads(json.dumps(settings))
+
+        if self.settings is None:
+            self.settings = settings
+            with open(self.path, 'w') as f:
+                f.write(json.dumps(settings) + '\n')
+
+        elif self.settings != settings:
+            raise ValueError('checkpoint %s was written by a sweep with different settings' % self.path)
+
+    def save(self, start, individual, results, store = None):
+        #record the finished block starting at run start, after its records are on disk
+
+        if store is not None:
+            store.flush()
+            self.store = store.state()
+
+        self.done[start] = [individual, results]
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'start': start, 'individual': individual, 'results': results, 'store': self.store}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def load_meta(path):
+    #settings and sizes of a store written by ResultStore
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        return json.load(f)
+
+
+def iter_chunks(path):
+    #columns of every chunk of a store in order, one chunk in memory at a time
+
+    for i in range(load_meta(path)['n_chunks']):
+        with np.load(os.path.join(path, 'chunk_%05d.npz' % i)) as chunk:
+            yield {name: chunk[name] for name in chunk.files}
+
+
+def iter_runs(path):
+    #run records of a store in run order, as dicts
+
+    group_size = load_meta(path)['group_size']
+
+    for chunk in iter_chunks(path):
+        nominal = unragged(chunk['nominal'], chunk['nominal_offsets'])
+        collaborative = unragged(chunk['collaborative'], chunk['collaborative_offsets'])
+        winner = unragged(chunk['winner'], chunk['collaborative_offsets'])
+
+        for i, run in enumerate(chunk['run']):
+            yield {'run': int(run),
+                   'nominal': nominal[i*group_size:(i + 1)*group_size],
+                   'nominal_K': chunk['nominal_KL'][i, :, 0].tolist(),
+                   'nominal_L': chunk['nominal_KL'][i, :, 1].tolist(),
+                   'collaborative': collaborative[i],
+                   'winner': winner[i],
+                   'collab_K': chunk['collab_KL'][i, :, 0].tolist(),
+                   'collab_L': chunk['collab_KL'][i, :, 1].tolist()}
+
+
+def iter_individual(path):
+    #individual baseline records of a store, as dicts
+
+    for chunk in iter_chunks(path):
+        individual = unragged(chunk['individual'], chunk['individual_offsets'])
+
+        for i, run in enumerate(chunk['individual_run']):
+            yield {'run': int(run), 'response': individual[i],
+                   'K': int(chunk['individual_KL'][i, 0]), 'L': int(chunk['individual_KL'][i, 1])}
+
+
+def load_results(path):
+    #whole store as (meta, run records, individual records)
+
+    return load_meta(path), list(iter_runs(path)), list(iter_individual(path))
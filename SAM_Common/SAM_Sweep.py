@@ -0,0 +1,483 @@
+#SAM_Sweep
+"""
+Sweeps over many parameter settings (cells) of the group recall model.
+
+A design is a list of cells, each a dict of parameter name -> value. Designs
+come from a full grid (grid_design), independent uniform draws (random_design)
+or a Latin hypercube (latin_hypercube), which stratifies every parameter so
+n cells cover each parameter's range evenly.
+
+run_cells splits every cell into blocks of runs and spreads the blocks of all
+cells over one process pool. Blocks are handed out most expensive first and
+each worker takes the next block as soon as it is free, so cells of very
+different cost (long lists, large groups) still keep every core busy. A cell's
+result is written to a JSON lines file as soon as its last block is in, and a
+sweep that was stopped skips the cells already in the file when called again.
+
+run_sweep runs many runs of one setting in blocks, serially or over a process
+pool, and folds the blocks into a SAM_Stats.SweepSummary in run order. How it
+runs them, checkpointed, stored, instrumented or adaptively, is a SweepConfig.
+run_parameter_sweep runs the same number of runs of every cell of a design.
+Both run the blocks of a model's driver, e.g. GroupRecall.run_chunk, which
+takes a RunTask namedtuple with the block's seed, runs and model settings.
+"""
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from scipy import stats
+from .SAM_Instrument import Counters, report
+from .SAM_Stats import SweepSummary
+from .SAM_Store import Checkpoint, ResultStore
+
+#stacked word associations a block of runs may encode at once, under 1GB with float64 associations and their samplers
+BLOCK_ASSOCIATIONS = 2**25
+
+#memory of an entry of sparse word associations (SAM_Sparse), a Python float in a dict, in dense word associations.
+#with r = 4 a block of 70 runs of 1500 items peaked at 740MB
+SPARSE_ENTRY = 5
+
+#how run_sweep runs a sweep:
+#n_jobs > 1 (or None for every core) spreads blocks of chunksize runs over a process pool, results are
+#collected in run order. Every run's result is identical to running serially, and the summary statistics are
+#folded in run by run in run order, so they are identical too
+#individual_runs = models the individual recall baseline is drawn from once per sweep, numruns by default
+#store = directory to stream every run's record to in chunks of store_chunk runs (SAM_Store), read it back
+#with SAM_Store.load_results
+#checkpoint = file recording every finished block of checkpoint_runs runs (SAM_Store.Checkpoint). Each block is
+#still run as tasks of chunksize runs, spread over the processes, and recorded once all its tasks are in. Calling
+#again with the same arguments, n_jobs and chunksize aside, skips the finished blocks and gives the same results
+#as an uninterrupted sweep, with seed = None the seed is taken from the checkpoint
+#instrument = True counts sampling attempts, rejections, recoveries, K rollbacks and rounds and times the
+#phases of every run (SAM_Instrument), and prints them per run and for the sweep
+#ci_width or alpha make the sweep adaptive: after the first numruns runs it adds batch_runs runs (numruns by
+#default) at a time until stop_sampling holds or max_runs (10*numruns by default) runs are done. Runs keep their
+#own random streams, so an adaptive sweep that stops after N runs gives the same results as a sweep of N runs
+#reservoir = number of (run, nominal length, collaborative length) to keep a uniform random sample of, and
+#progress = True prints the running means after every block
+SweepConfig = namedtuple('SweepConfig', ['n_jobs', 'chunksize', 'individual_runs', 'store', 'store_chunk', 'checkpoint',
+                                         'checkpoint_runs', 'instrument', 'ci_width', 'alpha', 'confidence', 'batch_runs',
+                                         'max_runs', 'reservoir', 'progress'],
+                         defaults = (1, None, None, None, 1000, None, 100, False, None, None, .95, None, None, 0, False))
+
+
+def grid_design(grid, fixed = None):
+    ''' grid = dict of parameter name -> list of values
+    fixed = dict of parameter name -> value shared by every cell
+
+    returns every combination of the values in grid, the last parameter varying fastest
+    '''
+
+    cells = [dict(fixed or {})]
+    for name, values in grid.items():
+        cells = [dict(cell, **{name: value}) for cell in cells for value in values]
+
+    return cells
+
+
+def scaled(bounds, u):
+    #values of the parameters in bounds at the points u in [0, 1), one row per cell and one column per parameter.
+    #a parameter with int bounds takes every integer from low to high inclusive with equal probability
+
+    cells = []
+    for row in u:
+        cell = {}
+        for (name, (low, high)), x in zip(bounds.items(), row):
+            if isinstance(low, (int, np.integer)) and isinstance(high, (int, np.integer)):
+                cell[name] = int(low + np.floor(x*(high - low + 1)))
+            else:
+                cell[name] = float(low + x*(high - low))
+        cells.append(cell)
+
+    return cells
+
+
+def random_design(bounds, n, seed = None, fixed = None):
+    ''' bounds = dict of parameter name -> (low, high)
+    n = number of cells
+    seed = seed of the draws
+    fixed = dict of parameter name -> value shared by every cell
+
+    returns n cells with every parameter drawn uniformly between its bounds
+    '''
+
+    u = np.random.default_rng(seed).random((n, len(bounds)))
+
+    return [dict(fixed or {}, **cell) for cell in scaled(bounds, u)]
+
+
+def hypercube(n, d, rng):
+    #n points of a Latin hypercube in [0, 1)^d: every column has one point in each of n equal strata
+
+    u = np.empty((n, d))
+    for j in range(d):
+        u[:, j] = (rng.permutation(n) + rng.random(n))/n
+
+    return u
+
+
+def latin_hypercube(bounds, n, seed = None, fixed = None):
+    #as random_design, but the range of every parameter is cut into n equal strata and each stratum holds one cell
+
+    u = hypercube(n, len(bounds), np.random.default_rng(seed))
+
+    return [dict(fixed or {}, **cell) for cell in scaled(bounds, u)]
+
+
+def load_cells(path):
+    #settings and finished cells (cell number -> result) of a sweep file written by run_cells, and the length
+    #in bytes of its complete lines
+
+    settings, done, end = None, {}, 0
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError: #unfinished last line
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                if settings is None:
+                    settings = entry
+                else:
+                    done[entry['cell']] = entry
+                end += len(line)
+
+    return settings, done, end
+
+
+def run_cells(cells, blocks, run_block, finish, n_jobs = 1, path = None, settings = None):
+    ''' cells = design, a list of dicts of parameter values
+    blocks = function of a cell returning its blocks in run order, as (cost, task) pairs. cost is any
+    number proportional to the block's running time, it only decides the order blocks are handed out in
+    run_block = function running one task in a worker, must be picklable (defined at module level)
+    finish = function of a cell, its tasks and their results in run order, returning the cell's JSON
+    serializable result
+    n_jobs = worker processes, 1 runs in this process, None uses every core
+    path = JSON lines file the results are written to as cells finish, cells already in it are skipped
+    settings = settings shared by every cell, a sweep file written with other settings is refused
+
+    returns the results of the cells, in design order, as {'cell', 'params', **result}
+    '''
+
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    cells = json.loads(json.dumps(cells))
+    settings = json.loads(json.dumps(settings))
+
+    done = {}
+    if path is not None:
+        old_settings, done, end = load_cells(path)
+        if old_settings is None:
+            with open(path, 'w') as f:
+                f.write(json.dumps(settings) + '\n')
+        elif old_settings != settings:
+            raise ValueError('sweep file %s was written with different settings' % path)
+        else: #drop a line cut short by a crash, that cell is simply run again
+            with open(path, 'r+') as f:
+                f.truncate(end)
+        for i, entry in done.items():
+            if i >= len(cells) or entry['params'] != cells[i]:
+                raise ValueError('sweep file %s was written for a different design' % path)
+
+    def save(i, tasks, results):
+        done[i] = dict(cell = i, params = cells[i], **finish(cells[i], tasks, results))
+        if path is not None:
+            with open(path, 'a') as f:
+                f.write(json.dumps(done[i]) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    todo = {i: blocks(cell) for i, cell in enumerate(cells) if i not in done}
+    tasks = {i: [task for cost, task in cell_blocks] for i, cell_blocks in todo.items()}
+
+    if n_jobs == 1:
+        for i in todo:
+            save(i, tasks[i], [run_block(task) for task in tasks[i]])
+    else:
+        costs = {(i, b): cost for i, cell_blocks in todo.items() for b, (cost, task) in enumerate(cell_blocks)}
+        results = {i: [None]*len(tasks[i]) for i in todo}
+        left = {i: len(tasks[i]) for i in todo}
+        with ProcessPoolExecutor(max_workers = n_jobs) as pool:
+            futures = {pool.submit(run_block, tasks[i][b]): (i, b) for i, b in sorted(costs, key = costs.get, reverse = True)}
+            try:
+                for future in as_completed(futures):
+                    i, b = futures[future]
+                    results[i][b] = future.result()
+                    left[i] -= 1
+                    if left[i] == 0: #the cell's last block, fold it in and free its results
+                        save(i, tasks[i], results.pop(i))
+            except BaseException: #don't run the blocks still queued, finished cells are already saved
+                pool.shutdown(cancel_futures = True)
+                raise
+
+    return [done[i] for i in range(len(cells))]
+
+
+def join_chunks(chunks):
+    #result of a block from the results of its parts, in run order
+    if len(chunks) == 1:
+        return chunks[0]
+
+    individual = [n for chunk in chunks for n in chunk[0]]
+    results = [r for chunk in chunks for r in chunk[1]]
+    records = None
+    if chunks[0][2] is not None:
+        records = {name: [r for chunk in chunks for r in chunk[2][name]] for name in ('individual', 'runs')}
+    counters = None
+    if chunks[0][3] is not None:
+        block_counters = Counters()
+        for chunk in chunks:
+            block_counters.merge(chunk[3][0])
+        counters = (block_counters, [c for chunk in chunks for c in chunk[3][1]])
+
+    return individual, results, records, counters
+
+
+def resume_chunks(tasks, parts, results, checkpoint = None):
+    #(block start, block result) for every task in run order, blocks finished in checkpoint are taken from it.
+    #parts are the tasks every block is run as and results only yields the parts of blocks that still had to be run
+    results = iter(results)
+
+    for task, task_parts in zip(tasks, parts):
+        start = task.runs.start
+        if checkpoint is not None and start in checkpoint.done:
+            yield start, checkpoint.done[start] + [None, None]
+        else:
+            yield start, join_chunks([next(results) for part in task_parts])
+
+
+def collect_chunks(chunks, summary, store = None, checkpoint = None, progress = False):
+    #fold the lengths of every block's recalls into summary (SAM_Stats.SweepSummary) in run order, streaming records
+    #to store as blocks arrive and recording every newly finished block in checkpoint, so memory does not grow with
+    #the number of runs. progress = True prints the summary after every block. Returns the SAM_Instrument.Counters
+    #of every instrumented run and of the whole sweep, blocks restored from a checkpoint were not instrumented
+    run_counters = [] #counters of every instrumented run
+    sweep_counters = Counters()
+
+    for start, (chunk_individual, chunk, records, counters) in chunks:
+        summary.add_block(start, chunk_individual, chunk)
+        if counters is not None:
+            block_counters, chunk_counters = counters
+            sweep_counters.merge(block_counters)
+            for c in chunk_counters:
+                sweep_counters.merge(c)
+            run_counters.extend(chunk_counters)
+        if progress:
+            print(summary)
+
+        if checkpoint is not None and start in checkpoint.done: #restored, its records are already stored
+            continue
+
+        if store is not None:
+            for record in records['individual']:
+                store.add_individual(*record)
+            for record in records['runs']:
+                store.add_run(*record)
+
+        if checkpoint is not None:
+            checkpoint.save(start, chunk_individual, chunk, store)
+
+    return run_counters, sweep_counters
+
+
+def block_tasks(task, first, last, chunksize, individual_runs, numruns):
+    #tasks for runs first to last in blocks of chunksize runs, task gives every other field.
+    #each block also draws its share of the individual baseline, individual_runs for every numruns runs
+    return [task._replace(runs = range(start, min(start + chunksize, last)),
+                          individual_runs = range(start*individual_runs//numruns, min(start + chunksize, last)*individual_runs//numruns))
+            for start in range(first, last, chunksize)]
+
+
+def model_associations(task):
+    #memory of one model of task in dense word associations: list_length**2, or for sparse word associations
+    #(SAM_Sparse) SPARSE_ENTRY for each of the at most 2*r + 1 entries of a row, with the models' default r = 4
+    if getattr(task, 'sparse', False):
+        return SPARSE_ENTRY*task.list_length*(2*(task.params or {}).get('r', 4) + 1)
+
+    return task.list_length**2
+
+
+def block_runs(task):
+    #most runs of task a block can encode within BLOCK_ASSOCIATIONS: every run encodes 2*group_size members and
+    #its share of the individual baseline, each taking model_associations
+    return max(1, BLOCK_ASSOCIATIONS//((2*task.group_size + 1)*model_associations(task)))
+
+
+def interval_width(lengths, list_length, confidence = .95):
+    #width of the t confidence interval of the mean proportion recalled from the RunningStats of recall lengths,
+    #inf for fewer than two runs
+    if lengths.count < 2:
+        return np.inf
+
+    return 2*stats.t.ppf((1 + confidence)/2, lengths.count - 1)*lengths.sem()/list_length
+
+
+def stop_sampling(summary, list_length, ci_width = None, alpha = None, paired = False, confidence = .95):
+    #sequential stopping rule of an adaptive sweep on its SweepSummary: the confidence intervals of the individual,
+    #nominal and collaborative proportions are all at most ci_width wide, or nominal and collaborative differ at alpha.
+    #testing after every batch makes a false positive more likely than alpha, so choose alpha smaller
+    if ci_width is not None and all(interval_width(lengths, list_length, confidence) <= ci_width
+                                    for lengths in (summary.individual, summary.nominal, summary.collaborative)
+                                    if lengths.count):
+        return True
+
+    if alpha is not None and summary.nominal.count > 1 and summary.ttest(paired).pvalue < alpha:
+        return True
+
+    return False
+
+
+def run_sweep(run_block, task, numruns, seed = None, settings = None, config = None):
+    ''' run_block = function running one block of runs in a worker, e.g. GroupRecall.run_chunk, must be picklable
+    task = the model's RunTask for every block, run_sweep fills in its seed, runs, individual_runs, record and instrument
+    numruns = runs of the sweep, the first batch of an adaptive sweep
+    seed = seed every run's random streams are spawned from, None for a fresh one
+    settings = JSON serializable model settings, saved with the store and checked against the checkpoint
+    config = SweepConfig, None for the defaults
+
+    prints and returns the sweep's SAM_Stats.SweepSummary
+    '''
+
+    config = SweepConfig() if config is None else config
+    list_length, paired = task.list_length, task.paired
+
+    checkpoint = None
+    if config.checkpoint is not None:
+        checkpoint = Checkpoint(config.checkpoint)
+        if seed is None and checkpoint.settings is not None:
+            seed = checkpoint.settings['seed']
+
+    sweep_seed = np.random.SeedSequence(seed)
+    n_jobs = os.cpu_count() if config.n_jobs is None else config.n_jobs
+    individual_runs = numruns if config.individual_runs is None else config.individual_runs
+    adaptive = config.ci_width is not None or config.alpha is not None
+    batch_runs = numruns if config.batch_runs is None else config.batch_runs
+    max_runs = 10*numruns if config.max_runs is None else config.max_runs
+
+    chunksize = config.chunksize
+    if chunksize is None: #serial runs encode up to 1000 runs at once, parallel runs split the sweep a few blocks per worker,
+        #and no block encodes more runs than fit in memory (block_runs)
+        chunksize = min(numruns, 1000) if n_jobs == 1 else max(1, -(-numruns//(4*n_jobs)))
+        chunksize = min(chunksize, block_runs(task))
+        if config.store is not None: #keep memory flat while streaming records
+            chunksize = min(chunksize, config.store_chunk)
+    #blocks are the checkpoint's, so a stopped sweep can be resumed with any n_jobs, and are run in parts of chunksize runs
+    block_size = chunksize if checkpoint is None else config.checkpoint_runs
+
+    settings = dict(settings or {}, numruns = numruns, seed = sweep_seed.entropy, individual_runs = individual_runs,
+                    ci_width = config.ci_width, alpha = config.alpha, confidence = config.confidence,
+                    batch_runs = batch_runs, max_runs = max_runs)
+
+    store_state = None
+    if checkpoint is not None:
+        checkpoint.begin(dict(settings, group_size = task.group_size, checkpoint_runs = config.checkpoint_runs,
+                              store_chunk = None if config.store is None else config.store_chunk))
+        store_state = checkpoint.store
+
+    store = None
+    if config.store is not None:
+        store = ResultStore(config.store, task.group_size, config.store_chunk, meta = settings, state = store_state)
+
+    task = task._replace(seed = sweep_seed.entropy, record = store is not None, instrument = config.instrument)
+
+    summary = SweepSummary(config.reservoir, np.random.SeedSequence(sweep_seed.entropy, spawn_key = (2,)))
+    run_counters, sweep_counters = [], Counters()
+    pool = ProcessPoolExecutor(max_workers = n_jobs) if n_jobs > 1 else None
+    try:
+        first, last = 0, numruns
+        while True: #one batch of runs, a fixed sweep has a single batch
+            tasks = block_tasks(task, first, last, block_size, individual_runs, numruns)
+            parts = [block_tasks(block, block.runs.start, block.runs.stop, chunksize, individual_runs, numruns)
+                     for block in tasks]
+            pending = [part for block, block_parts in zip(tasks, parts)
+                       if checkpoint is None or block.runs.start not in checkpoint.done for part in block_parts]
+            results = map(run_block, pending) if pool is None else pool.map(run_block, pending)
+
+            batch_counters = collect_chunks(resume_chunks(tasks, parts, results, checkpoint), summary, store, checkpoint,
+                                            config.progress)
+            run_counters.extend(batch_counters[0])
+            sweep_counters.merge(batch_counters[1])
+
+            if (not adaptive or last >= max_runs or
+                stop_sampling(summary, list_length, config.ci_width, config.alpha, paired, config.confidence)):
+                break
+            first, last = last, min(last + batch_runs, max_runs)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if store is not None:
+        store.close()
+
+    print('individual: ', summary.individual.mean/list_length, summary.individual.std()/list_length,'\nnominal: ', summary.nominal.mean/list_length, summary.nominal.std()/list_length, 
+    '\ncollaborative: ', summary.collaborative.mean/list_length, summary.collaborative.std()/list_length)
+    if paired:
+        print('nominal - collaborative: ', summary.difference.mean/list_length, 'standard error: ', summary.difference.sem()/list_length)
+    print('Collaborative statistically different from nominal? ', summary.ttest(paired))
+    if adaptive:
+        print('runs: ', summary.nominal.count, 'confidence interval widths: ',
+              [float(interval_width(lengths, list_length, config.confidence))
+               for lengths in (summary.individual, summary.nominal, summary.collaborative)])
+    print('seed: ', sweep_seed.entropy)
+
+    if config.instrument:
+        report(run_counters, sweep_counters)
+
+    return summary
+
+
+def cell_blocks(cell, task, numruns, chunksize, individual_runs, first = 0, last = None):
+    #(cost, task) of every block of a parameter sweep cell, task gives the settings the cell does not: cell values
+    #of task fields (list_length, group_size...) override them and the other cell values are the params. first and
+    #last select part of the cell's numruns runs. cost counts the word associations encoded, which dominate a
+    #block's running time (model_associations)
+    task = task._replace(params = {name: value for name, value in cell.items() if name not in task._fields},
+                         **{name: value for name, value in cell.items() if name in task._fields})
+    chunksize = min(chunksize, block_runs(task)) #cells with long lists or large groups get smaller blocks
+    tasks = block_tasks(task, first, numruns if last is None else last, chunksize, individual_runs, numruns)
+
+    return [(len(block.runs)*(2*task.group_size + 1)*model_associations(task), block) for block in tasks]
+
+
+def run_parameter_sweep(run_block, task, design, numruns, settings = None, seed = None, n_jobs = None, chunksize = None,
+                        individual_runs = None, path = None):
+    ''' run_block = function running one block of runs in a worker, e.g. GroupRecall.run_chunk
+    task = the model's RunTask, cells override its fields and params (see cell_blocks)
+    design = list of dicts of parameter values from grid_design, random_design or latin_hypercube
+    numruns = runs of every cell
+    settings = JSON serializable model settings, a sweep file written with other settings is refused
+    seed = seed of every cell's runs
+    n_jobs = worker processes shared by the blocks of all cells, every core by default
+    chunksize = runs per block, a few blocks per worker over the whole sweep by default
+    individual_runs = models of every cell's individual recall baseline, numruns by default
+    path = JSON lines file every finished cell's statistics are written to, cells already in it are skipped
+
+    every cell uses the same seed, so cells draw the same random streams and differences between cells come from
+    the parameters rather than from sampling noise. returns the cells' statistics in design order, means and
+    standard deviations are proportions of the list recalled (SAM_Stats.SweepSummary.as_dict)
+    '''
+
+    sweep_seed = np.random.SeedSequence(seed)
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    individual_runs = numruns if individual_runs is None else individual_runs
+    if chunksize is None: #a few blocks per worker over the whole sweep, so large cells are split between workers
+        chunksize = max(1, min(numruns, 1000, -(-numruns*len(design)//(4*n_jobs))))
+
+    settings = dict(settings or {}, numruns = numruns, group_size = task.group_size, seed = sweep_seed.entropy,
+                    individual_runs = individual_runs)
+    task = task._replace(seed = sweep_seed.entropy)
+
+    def blocks(cell):
+        return cell_blocks(cell, task, numruns, chunksize, individual_runs)
+
+    def finish(cell, tasks, results):
+        summary = SweepSummary()
+        for task, result in zip(tasks, results):
+            summary.add_block(task.runs.start, result[0], result[1])
+        row = summary.as_dict(cell.get('list_length', task.list_length), task.paired)
+        print(cell, 'nominal: ', row['nominal']['mean'], 'collaborative: ', row['collaborative']['mean'])
+        return row
+
+    return run_cells(design, blocks, run_block, finish, n_jobs, path, settings)
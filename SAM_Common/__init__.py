@@ -0,0 +1,10 @@
+#SAM_Common
+"""
+Helpers shared by the uncategorized and categorized SAM models.
+
+SAM_Encoding, SAM_Sampling, SAM_Clock and SAM_Batch build and run the
+models, SAM_Sweep, SAM_Fit, SAM_Stats, SAM_Store and SAM_Instrument
+drive and record parameter sweeps and SAM_Benchmark times them. The drivers in
+Uncategorized-Model and Categorized-Model put the repository folder on sys.path
+and import from here.
+"""
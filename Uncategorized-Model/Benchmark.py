@@ -0,0 +1,131 @@
+#Benchmark
+"""
+Benchmarks of the uncategorized model's hot paths.
+
+For every point of a grid of list lengths, group sizes, Kmax and Lmax this
+measures runs per second and peak memory of each phase separately:
+
+encode          encoding the study list, models encoded per second
+free_recall     SAM_Nominal_Uncategorized.free_recall, model by model
+batch_free_recall   the same recalls in lockstep (SAM_Batch), also below its break-even size
+context_sample  one context search (context_recall) of a fresh collaborative model
+wordcue_sample  one word cue search (wordcue_recall) from a random cue
+group_race      GroupRecall.group_recall of a group, groups per second
+run             whole runs of a sweep (GroupRecall.run_chunk), runs per second
+
+Everything runs on the CPU with no network access. Save results from two
+commits and compare them:
+
+    python Benchmark.py -o before.json
+    python Benchmark.py -o after.json
+    python Benchmark.py --compare before.json after.json
+"""
+import argparse
+import numpy as np
+import os
+import sys
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #SAM_Common sits next to the model folders
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from SAM_Group_Uncategorized import SAM_Group_Uncategorized
+from SAM_Nominal_Uncategorized import SAM_Nominal_Uncategorized
+from SAM_Common.SAM_Batch import batch_free_recall
+from SAM_Common.SAM_Benchmark import measure, grid_points, save_results, compare
+from GroupRecall import group_recall, run_chunk, RunTask
+
+GRID = {'list_length': [40, 100], 'group_size': [3, 6, 16], 'Kmax': [15, 30], 'Lmax': [3, 6]}
+QUICK_GRID = {'list_length': [40], 'group_size': [3], 'Kmax': [30], 'Lmax': [3]}
+
+
+def benchmark_point(list_length, group_size, Kmax, Lmax, models = 50, groups = 20, runs = 10, repeat = 3, seed = 0,
+                    run_phase = True):
+    ''' list_length, group_size, Kmax, Lmax = grid point
+    models = models encoded or recalled per call of the model phases
+    groups = groups recalled per call of the group race phases
+    runs = sweep runs per call of the run phase
+    repeat = timed calls per phase
+    seed = seed of every phase's models, the same work is measured on every call and every commit
+    run_phase = False skips the run phase
+    '''
+
+    params = {'list_length': list_length, 'group_size': group_size, 'Kmax': Kmax, 'Lmax': Lmax}
+    kwargs = {'Kmax': Kmax, 'Lmax': Lmax}
+    results = []
+
+    def add(model, phase, result):
+        results.append(dict(model = model, phase = phase, params = params, **result))
+
+    def nominal():
+        return SAM_Nominal_Uncategorized.batch(models, list_length, rng = seed, **kwargs)
+
+    def collaborative():
+        return SAM_Group_Uncategorized.batch(models, list_length, rng = seed, **kwargs)
+
+    def collaborative_groups():
+        group_models = SAM_Group_Uncategorized.batch(groups*group_size, list_length, rng = seed, **kwargs)
+        return [group_models[k*group_size:(k + 1)*group_size] for k in range(groups)]
+
+    def cues():
+        return collaborative(), np.random.default_rng(seed).integers(list_length, size = models)
+
+    add('SAM_Nominal_Uncategorized', 'encode', measure(lambda: None, lambda x: nominal(), models, repeat))
+    add('SAM_Group_Uncategorized', 'encode', measure(lambda: None, lambda x: collaborative(), models, repeat))
+    add('SAM_Nominal_Uncategorized', 'free_recall',
+        measure(nominal, lambda ms: [g.free_recall() for g in ms], models, repeat))
+    add('SAM_Nominal_Uncategorized', 'batch_free_recall',
+        measure(nominal, lambda ms: batch_free_recall(ms, batch_size = 0, batch_length = list_length), models, repeat))
+    add('SAM_Group_Uncategorized', 'context_sample',
+        measure(collaborative, lambda ms: [g.context_recall() for g in ms], models, repeat))
+    add('SAM_Group_Uncategorized', 'wordcue_sample',
+        measure(cues, lambda x: [g.wordcue_recall(cue) for g, cue in zip(*x)], models, repeat))
+    add('SAM_Group_Uncategorized', 'group_race',
+        measure(collaborative_groups, lambda gs: [group_recall(group) for group in gs], groups, repeat))
+
+    #run_chunk uses the models' default Kmax and Lmax, so this phase only depends on list length and group size
+    if not run_phase:
+        return results
+
+    task = RunTask(np.random.SeedSequence(seed).entropy, range(runs), range(runs), list_length, group_size)
+    results.append({'model': 'GroupRecall', 'phase': 'run', 'params': {'list_length': list_length, 'group_size': group_size},
+                    **measure(lambda: None, lambda x: run_chunk(task), runs, repeat)})
+
+    return results
+
+
+def run_benchmarks(grid = GRID, repeat = 3, seed = 0, **counts):
+    #benchmark every point of grid, counts are passed on to benchmark_point
+    results = []
+    run_points = set() #points whose run phase was measured, it does not depend on Kmax and Lmax
+
+    for point in grid_points(grid):
+        run_point = (point['list_length'], point['group_size'])
+        for result in benchmark_point(repeat = repeat, seed = seed, run_phase = run_point not in run_points, **point, **counts):
+            results.append(result)
+            print('%-26s %-18s %s  %10.1f runs/s  %8.2f MB' % (result['model'], result['phase'], result['params'],
+                                                               result['runs_per_s'], result['peak_bytes']/2**20))
+        run_points.add(run_point)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the uncategorized SAM model')
+    parser.add_argument('-o', '--output', default = 'benchmark.json', help = 'JSON file to save results to')
+    parser.add_argument('--quick', action = 'store_true', help = 'one small grid point and fewer runs')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'timed calls per phase')
+    parser.add_argument('--compare', nargs = 2, metavar = ('OLD', 'NEW'), help = 'compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.quick:
+        results = run_benchmarks(QUICK_GRID, repeat = 1, models = 10, groups = 5, runs = 3)
+    else:
+        results = run_benchmarks(GRID, repeat = args.repeat)
+
+    save_results(args.output, results)
+
+if __name__ == "__main__":
+    main()
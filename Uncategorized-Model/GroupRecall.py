@@ -6,33 +6,76 @@ Group Recall
 @author: willamannering
 """
 
+import os
+import sys
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #SAM_Common sits next to the model folders
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 from SAM_Group_Uncategorized import SAM_Group_Uncategorized
 from SAM_Nominal_Uncategorized import SAM_Nominal_Uncategorized
+from SAM_Common.SAM_Sampling import make_rng, spawn_rngs
+from SAM_Common.SAM_Batch import batch_free_recall, batch_group_recall
+from SAM_Common.SAM_Instrument import Counters
+from SAM_Common.SAM_Sweep import run_sweep
+from SAM_Common import SAM_Fit, SAM_Sweep
+from collections import namedtuple
 import numpy as np
-from scipy import stats
+import time
 
+#parameters of the SAM models a parameter sweep can vary, besides list_length and group_size
+MODEL_PARAMETERS = ('t', 'r', 'sam_a', 'sam_b', 'sam_c', 'sam_d', 'sam_e', 'sam_f', 'sam_g', 'Kmax', 'Lmax')
 
-def update_group_response(group, group_response):
+
+def share_group_recalled(group):
+    #give every member the same array of items recalled by the group
+    recalled = np.zeros(group[0].ListLength, dtype = bool)
     for g in group:
-        g.group_response = group_response
+        recalled |= g.group_recalled
         
-def get_fastest_response(r, accum_time): #helper function for group_context_recall
-    
-    if accum_time == [0]*len(accum_time):
-    
-        fastest_response = min(r)[1] #fastest response of any of the group members
-        response_time = min(r)[0] #timestamp for fastest response
+    for g in group:
+        g.group_recalled = recalled
+        for item in np.flatnonzero(recalled):
+            g.mark_recalled(item)
+
+def update_group_response(group, response):
+    #mark response as recalled for every member, members check the shared array in O(1)
+    for g in group:
+        g.mark_recalled(response)
         
-    else:
+def break_ties(group, times, fails, response_time, members):
+    #winner of a round whose fastest response came at response_time, among members (indices into group) with
+    #response times times and failure times fails. Simulated times of a FixedClock tie often, so attempts at
+    #exactly response_time are put in order as continuous times would be: every member with such an attempt
+    #draws a uniform priority from its own stream and the success with the lowest priority wins.
+    #returns the winner and the priority of every tied member, empty if the winner was the only one
+    tied = [i for i in members if times[i] == response_time or response_time in fails[i]]
+    if len(tied) < 2:
+        return tied[0], {}
+
+    priority = {i: group[i].uniforms.random() for i in tied}
+
+    return min([i for i in tied if times[i] == response_time], key = priority.get), priority
+
+def count_late_fails(fails, response_time, priority, i, winner):
+    #failures of member i after the winner's response, a failure at the response time itself counts if member i
+    #drew a higher priority than the winner (see break_ties)
+    return len([f for f in fails if f > response_time or
+                (f == response_time and priority.get(i, 0) > priority.get(winner, 0))])
+
+def get_fastest_response(r, accum_time, group): #helper function for group_context_recall
+    
+    if accum_time != [0]*len(accum_time): #add time accumulated in failed wordcue recall before this context recall
         for i in range(len(accum_time)):
-            r[i][0] = r[i][0] + max(accum_time[i])
-        
-        fastest_response = min(r)[1]
-        response_time = min(r)[0]
+            r[i][0] = r[i][0] + max(accum_time[i], default = 0)
+    
+    response_time = min(x[0] for x in r) #timestamp for fastest response
+    fails = [accum_time[i] + r[i][3] for i in range(len(r))] #failure times of every member, including the last word cue round
+    winner, priority = break_ties(group, [x[0] for x in r], fails, response_time, [i for i in range(len(r)) if r[i][1] != -1])
+    fastest_response = r[winner][1] #fastest response of any of the group members
         
-    return fastest_response, response_time, r
+    return fastest_response, response_time, winner, r, fails, priority
 
-def group_context_recall(group, accum_time): 
+def group_context_recall(group, accum_time, counters = None): 
     #all models start off doing context recall at the same time. Whichever finishes first "wins" and that response is added
 
     r = []
@@ -41,12 +84,13 @@ def group_context_recall(group, accum_time):
         
     if min(r)[1] == -1: #if fastest model's response = -1, then all models failed to retrieve
         fastest_response = -1
+        winner = -1
         
     else:
-        fastest_response, response_time, r = get_fastest_response(r, accum_time)
+        fastest_response, response_time, winner, r, fails, priority = get_fastest_response(r, accum_time, group)
         
         for i in range(len(r)):#for each of the group members
-            if r[i][0] == response_time: #if current model produced fastest response, don't need to do anything for model 
+            if i == winner: #if current model produced fastest response, don't need to do anything for model 
                 
                 group[i].update_assoc(fastest_response)#update associations for fastest response
                 
@@ -54,15 +98,16 @@ def group_context_recall(group, accum_time):
                 continue
             else:
                 
-                total_times = accum_time[i] + r[i][3]
-                count_fails = len([f for f in total_times if f > response_time])#count how many retrieval failures happened after the fastest response
+                count_fails = count_late_fails(fails[i], response_time, priority, i, winner)#count how many retrieval failures happened after the fastest response
                 group[i].K = group[i].K - count_fails
+                if counters is not None:
+                    counters.K_rollbacks += count_fails
                 group[i].update_assoc(fastest_response) #update associations involved with fastest response
     
-    return fastest_response, accum_time, r
+    return fastest_response, accum_time, r, winner
 
 
-def group_wordcue_recall(cue, group, accum_time):
+def group_wordcue_recall(cue, group, accum_time, counters = None):
     #all models start off doing wordcue recall at the same time. Whichever finishes first "wins" and that response is added
     #to the group_response vector
     r = []
@@ -74,8 +119,12 @@ def group_wordcue_recall(cue, group, accum_time):
         else:
             r.append(g.wordcue_recall(cue))
     
-    fastest_response = min(r)[1] #fastest response of any of the group members
-    response_time = min(r)[0] #timestamp for fastest response
+    response_time = min(x[0] for x in r) #timestamp for fastest response
+    winner, priority = -1, {}
+    fastest_response = -1
+    if response_time != float('inf'): #member with the fastest simulated time, ties broken as in break_ties
+        winner, priority = break_ties(group, [x[0] for x in r], [x[3] for x in r], response_time, range(len(r)))
+        fastest_response = r[winner][1] #fastest response of any of the group members
     
 
     if fastest_response == -1: #if no models produce a response record time accumulation because all models have reached lmax
@@ -86,52 +135,64 @@ def group_wordcue_recall(cue, group, accum_time):
     else: #if any model successfully produced a response
         
         for i in range(len(r)):
-            if r[i][0] == response_time: #don't need to do anything for model that produced the min response
+            if i == winner: #don't need to do anything for model that produced the min response
                 
                 group[i].update_assoc(fastest_response, cue)
                 
             elif r[i][1] == -1: #if a model didn't produce a response  
-                count_fails = len([f for f in r[i][3] if f > response_time])#count how many retrieval failures happened after the fastest response
+                count_fails = count_late_fails(r[i][3], response_time, priority, i, winner)#count how many retrieval failures happened after the fastest response
                 group[i].K = group[i].K - count_fails #get rid of Ks that happened after fastest response
+                if counters is not None:
+                    counters.K_rollbacks += count_fails
                 group[i].update_assoc(fastest_response, cue) #update association with fastest response
 
             else:
-                count_fails = len([f for f in r[i][3] if f > response_time])#count how many retrieval failures happened after the fastest response
+                count_fails = count_late_fails(r[i][3], response_time, priority, i, winner)#count how many retrieval failures happened after the fastest response
                 group[i].K = group[i].K - count_fails
+                if counters is not None:
+                    counters.K_rollbacks += count_fails
                 group[i].update_assoc(fastest_response, cue) #update associations involved with fastest response
                 
 
-    return fastest_response, accum_time
+    return fastest_response, accum_time, winner
 
-def individual_recall(num_runs, list_length):
+def individual_recall(num_runs, list_length, rng = None, sparse = False, dtype = np.float64):
 
     len_response = []
 
-    for i in range(num_runs):
-        sam = SAM_Nominal_Uncategorized(list_length)
-        len_response.append(len(sam.free_recall()))
+    for response in batch_free_recall(SAM_Nominal_Uncategorized.batch(num_runs, list_length, rng = rng, sparse = sparse, dtype = dtype)):
+        len_response.append(len(response))
 
     return len_response
 
 def nominal_recall(group):
     nominal_response = []
 
-    for g in group:
-        r = g.free_recall()
+    for r in batch_free_recall(group):
         nominal_response.extend(r)
         
     return set(nominal_response)
 
 
-def group_recall(group):
+def group_recall(group, race_size = 16, winners = None, counters = None):
+    #groups of race_size or more members race in stacked arrays (SAM_Batch.GroupRace), which is faster
+    #for large groups and gives the same response as the member by member race below
+    #winners = optional list, the member that produced each response is appended to it
+    #counters = SAM_Instrument.Counters for the race's rounds, round times and K rollbacks
+    if len(group) >= race_size and not group[0].sparse: #the stacked race needs dense associations
+        return batch_group_recall(group, winners = winners, counters = counters)
     
     group_response = []
+    share_group_recalled(group)
     accum_recall_times = [[0]]*len(group) #keep track of each models accumulative time until one produces a response
 
     while( any([g for g in group if g.K < g.Kmax])): #while at least one model hasn't reached Kmax yet, keep recalling
         
         #begin with context_recall
-        g1 = group_context_recall(group, accum_recall_times)
+        start = time.perf_counter()
+        g1 = group_context_recall(group, accum_recall_times, counters)
+        if counters is not None:
+            counters.add_round('context', start)
         
         if (g1[0] == -1): #if no model is able to retrieve a memory, that means all models reached kmax, so recall ends
             break
@@ -141,11 +202,16 @@ def group_recall(group):
             current_response = g1[0]
             
             group_response.append(current_response) #add current response to total group response
-            update_group_response(group, group_response) #update internal group response tracker for individual models
+            if winners is not None:
+                winners.append(g1[3])
+            update_group_response(group, current_response) #update internal group response tracker for individual models
         
         while(current_response != -1): #if cue has been recalled via context, use that cue to continue recall
         #once a cue is recalled, use that cue for recall
-            g2 = group_wordcue_recall(current_response, group, accum_recall_times)
+            start = time.perf_counter()
+            g2 = group_wordcue_recall(current_response, group, accum_recall_times, counters)
+            if counters is not None:
+                counters.add_round('wordcue', start)
             if (g2[0] == -1):
                 accum_recall_times = g2[1] #if all models reach lmax and produce no response, keep track of accum times for context recall
                 break
@@ -154,41 +220,214 @@ def group_recall(group):
                 r = g2[0]
                 
                 group_response.append(r) #add new response to group_response
+                if winners is not None:
+                    winners.append(g2[2])
 
-                update_group_response(group, group_response) #update internal group response tracker for individual models
+                update_group_response(group, r) #update internal group response tracker for individual models
                 current_response = r
     
     return group_response
 
-def run_group_recall(numruns, list_length, group_size):
-    #do group recall X amount of times
-    len_collab = []
-    len_nom = []
- 
-    for i in range(numruns):
-        nominal_group = []
-        collab_group = []
-        individual = []
-        
-        for j in range(group_size):
-            nominal_group.append(SAM_Nominal_Uncategorized(list_length))
-            collab_group.append(SAM_Group_Uncategorized(list_length))
-        
-        #perform individual recall
-        individual.append(individual_recall(numruns, list_length))
+def run_streams(run_seed, group_size, paired = False):
+    #independent generators for one run: nominal members and collaborative members
+    #paired = True gives collaborative member j a generator in the same state as nominal member j's, so both encode
+    #the same memories and recall from the same uniform numbers (common random numbers)
+    nominal_seed, collab_seed = run_seed.spawn(2)
+
+    if paired:
+        member_seeds = nominal_seed.spawn(group_size)
+        return [np.random.default_rng(s) for s in member_seeds], [np.random.default_rng(s) for s in member_seeds]
+
+    return spawn_rngs(nominal_seed, group_size), spawn_rngs(collab_seed, group_size)
+
+def run_seed(seed, run):
+    #SeedSequence of run number `run` of a sweep
+    return np.random.SeedSequence(seed, spawn_key = (0, run))
+
+def individual_seed(seed, run):
+    #SeedSequence of individual baseline number `run` of a sweep, kept apart from the group runs
+    return np.random.SeedSequence(seed, spawn_key = (1, run))
+
+def replay_run(seed, run, list_length, group_size, clock = None, exclude_recalled = False,
+               paired = False, sparse = False, dtype = np.float64, params = None):
+    #repeat run number `run` of run_group_recall(numruns, list_length, group_size, seed = seed) exactly
+    #and returns its nominal response and collaborative response
+    nominal_rngs, collab_rngs = run_streams(run_seed(seed, run), group_size, paired)
+    params = params or {}
+
+    nominal_group = SAM_Nominal_Uncategorized.batch(group_size, list_length, rng = nominal_rngs, sparse = sparse, dtype = dtype,
+                                                    **params)
+    collab_group = SAM_Group_Uncategorized.batch(group_size, list_length, rng = collab_rngs, clock = clock,
+                                                 exclude_recalled = exclude_recalled, sparse = sparse, dtype = dtype, **params)
+
+    return nominal_recall(nominal_group), group_recall(collab_group)
+
+#a block of runs for run_chunk: runs and individual_runs are ranges of run numbers of the sweep seeded by seed, the
+#other fields are run_group_recall's arguments. record asks for the block's records (SAM_Store), instrument for its
+#SAM_Instrument.Counters and params are model parameters given to every model, None for the defaults
+RunTask = namedtuple('RunTask', ['seed', 'runs', 'individual_runs', 'list_length', 'group_size', 'clock', 'exclude_recalled',
+                                 'paired', 'sparse', 'dtype', 'record', 'instrument', 'params'],
+                     defaults = (None, False, False, False, np.float64, False, False, None))
+
+def run_chunk(task):
+    #run a block of runs of a sweep, called directly or in a worker process
+    #returns the block's individual recall lengths, (nominal length, collaborative length) for each run in order
+    #and, if the task asks to record, the block's individual and run records for SAM_Store.ResultStore
+    #and, if it asks to instrument, SAM_Instrument.Counters for the block (phase times, individual baseline)
+    #and for every run. task is a RunTask
+    runs, individual_runs, list_length, group_size = task.runs, task.individual_runs, task.list_length, task.group_size
+    params = task.params or {}
+
+    block_counters = Counters() if task.instrument else None
+    run_counters = [Counters() for i in runs] if task.instrument else None
+
+    #perform individual recall for this block's share of the sweep's individual baseline
+    start = time.perf_counter()
+    individual_models = SAM_Nominal_Uncategorized.batch(len(individual_runs), list_length,
+                                                        rng = [make_rng(individual_seed(task.seed, i)) for i in individual_runs],
+                                                        sparse = task.sparse, counters = block_counters, dtype = task.dtype,
+                                                        **params)
+    if task.instrument:
+        block_counters.add_time('encode', start)
+    start = time.perf_counter()
+    individual_responses = batch_free_recall(individual_models)
+    if task.instrument:
+        block_counters.add_time('individual_recall', start)
+    individual = [len(response) for response in individual_responses]
+
+    streams = [run_streams(run_seed(task.seed, i), group_size, task.paired) for i in runs]
+
+    #encode every run's group members up front, member j of the k-th run is model k*group_size + j
+    start = time.perf_counter()
+    nominal_models = SAM_Nominal_Uncategorized.batch(len(runs)*group_size, list_length,
+                                                     rng = [g for s in streams for g in s[0]], sparse = task.sparse,
+                                                     dtype = task.dtype, **params)
+    collab_models = SAM_Group_Uncategorized.batch(len(runs)*group_size, list_length,
+                                                  rng = [g for s in streams for g in s[1]], clock = task.clock,
+                                                  exclude_recalled = task.exclude_recalled, sparse = task.sparse,
+                                                  dtype = task.dtype, **params)
+
+    if task.instrument: #members count their sampling in their run's counters
+        block_counters.add_time('encode', start)
+        for m in range(len(runs)*group_size):
+            nominal_models[m].counters = collab_models[m].counters = run_counters[m//group_size]
+
+    #perform nominal recall for every run of the block in lockstep
+    start = time.perf_counter()
+    nominal_responses = batch_free_recall(nominal_models)
+    if task.instrument:
+        block_counters.add_time('nominal_recall', start)
+
+    results = []
+    records = {'individual': [], 'runs': []} if task.record else None
+    if task.record:
+        for i, g, response in zip(individual_runs, individual_models, individual_responses):
+            records['individual'].append((i, response, g.K, g.L))
+
+    for k in range(len(runs)):
+        collab_group = collab_models[k*group_size:(k+1)*group_size]
+
+        #pool the nominal group's responses
+        nominal_response = set(r for response in nominal_responses[k*group_size:(k+1)*group_size] for r in response)
 
-        #perform nominal recall
-        nominal_response = nominal_recall(nominal_group)
-        len_nom.append(len(nominal_response))
-        
         #perfrom collaborative recall
-        group_response = group_recall(collab_group)
-        len_collab.append(len(group_response))
-      
-        
-    print('individual: ', np.mean(individual)/list_length, np.std(individual)/list_length,'\nnominal: ', np.mean(len_nom)/list_length, np.std(len_nom)/list_length, 
-    '\ncollaborative: ', np.mean(len_collab)/list_length, np.std(len_collab)/list_length)
-    print('Collaborative statistically different from nominal? ', stats.ttest_ind(len_nom, len_collab))
+        winners = [] if task.record else None
+        start = time.perf_counter()
+        group_response = group_recall(collab_group, winners = winners,
+                                      counters = run_counters[k] if task.instrument else None)
+        if task.instrument:
+            run_counters[k].add_time('collaborative_recall', start)
+
+        results.append((len(nominal_response), len(group_response)))
+
+        if task.record:
+            nominal_group = nominal_models[k*group_size:(k+1)*group_size]
+            records['runs'].append((runs[k], nominal_responses[k*group_size:(k+1)*group_size],
+                                    [(g.K, g.L) for g in nominal_group], group_response, winners,
+                                    [(g.K, g.L) for g in collab_group]))
+
+    return individual, results, records, (block_counters, run_counters) if task.instrument else None
+
+def run_group_recall(numruns, list_length, group_size, clock = None, exclude_recalled = False, seed = None,
+                     paired = False, sparse = False, dtype = np.float64, params = None, config = None):
+    #do group recall X amount of times, every run draws from its own random streams spawned from seed
+    #paired = True gives each run's nominal and collaborative members the same encoded memories and random
+    #streams, so the nominal - collaborative difference is compared with a paired t-test (see run_streams)
+    #sparse = True stores word associations sparsely (SAM_Sparse.SparseAssoc), for long study lists
+    #dtype = np.float32 halves the memory of the association arrays, see precision_check
+    #params = model parameters given to every model, e.g. {'sam_a': .1, 'Kmax': 20}, see run_parameter_sweep
+    #config = SAM_Sweep.SweepConfig: processes, blocks, storing, checkpointing, instrumenting and adaptive stopping.
+    #statistics are accumulated as blocks arrive (SAM_Stats), so memory stays flat however many runs are done.
+    #returns the sweep's SweepSummary
+    settings = {'list_length': list_length, 'exclude_recalled': exclude_recalled,
+                'clock': None if clock is None else [type(clock).__name__, clock.cost],
+                'paired': paired, 'sparse': sparse, 'dtype': np.dtype(dtype).name, 'params': params}
+    task = RunTask(None, None, None, list_length, group_size, clock, exclude_recalled, paired, sparse, dtype,
+                   params = params)
+
+    return run_sweep(run_chunk, task, numruns, seed, settings, config)
+
+def run_parameter_sweep(design, numruns, list_length = 40, group_size = 3, clock = None, exclude_recalled = False,
+                        seed = None, n_jobs = None, chunksize = None, individual_runs = None, paired = False,
+                        sparse = False, dtype = np.float64, path = None):
+    #run numruns runs of every cell of design, a list of dicts of parameter values from SAM_Sweep.grid_design,
+    #random_design or latin_hypercube. A cell can set list_length, group_size and any of MODEL_PARAMETERS, the rest
+    #take the values given here. Blocks of chunksize runs from all cells share one pool of n_jobs processes (every
+    #core by default), see SAM_Sweep.run_parameter_sweep and SAM_Sweep.run_cells. path = JSON lines file every
+    #finished cell's statistics are written to, calling again skips the cells already in it
+    for cell in design:
+        unknown = set(cell) - set(MODEL_PARAMETERS) - {'list_length', 'group_size'}
+        if unknown:
+            raise ValueError('unknown parameters %s' % sorted(unknown))
+
+    settings = {'list_length': list_length, 'exclude_recalled': exclude_recalled,
+                'clock': None if clock is None else [type(clock).__name__, clock.cost],
+                'paired': paired, 'sparse': sparse, 'dtype': np.dtype(dtype).name}
+    task = RunTask(None, None, None, list_length, group_size, clock, exclude_recalled, paired, sparse, dtype)
+
+    return SAM_Sweep.run_parameter_sweep(run_chunk, task, design, numruns, settings, seed, n_jobs, chunksize,
+                                         individual_runs, path)
+
+def fit_parameters(targets, bounds, numruns = 200, list_length = 40, group_size = 3, fixed = None, weights = None,
+                   seed = None, n_jobs = None, stages = None, clock = None, exclude_recalled = False,
+                   sparse = False, dtype = np.float64, **search):
+    #fit model parameters to observed recall: targets = dict of observed mean proportions recalled by 'individual',
+    #'nominal' and 'collaborative' groups (any of them), bounds = dict of MODEL_PARAMETERS -> (low, high) searched,
+    #fixed = values of other parameters (list_length, group_size, MODEL_PARAMETERS) held by every candidate.
+    #searches with differential evolution (SAM_Fit.fit, search takes its population, generations, mutation,
+    #crossover, z and tol). Every candidate runs numruns runs from the same seed, so candidates are compared on
+    #common random numbers, in stages of runs (numruns/8, /4, /2 and numruns by default) that stop trials clearly
+    #worse than their parents early. Each stage's runs of all candidates share a pool of n_jobs processes
+    #(every core by default), see SAM_Fit.fit_parameters. returns the best parameters, their loss and mean
+    #proportions, and the runs simulated
+    unknown = set(targets) - {'individual', 'nominal', 'collaborative'}
+    if unknown:
+        raise ValueError('unknown targets %s' % sorted(unknown))
+    unknown = (set(bounds) - set(MODEL_PARAMETERS)) | (set(fixed or {}) - set(MODEL_PARAMETERS) - {'list_length', 'group_size'})
+    if unknown:
+        raise ValueError('unknown parameters %s' % sorted(unknown))
+
+    task = RunTask(None, None, None, list_length, group_size, clock, exclude_recalled, False, sparse, dtype)
+
+    return SAM_Fit.fit_parameters(run_chunk, task, targets, bounds, numruns, fixed, weights, seed, n_jobs, stages, **search)
+
+def precision_check(numruns, list_length, group_size, seed = 0, tolerance = .01):
+    #check that dtype = np.float32 leaves recall statistics within tolerance of float64: runs the same sweep in both
+    #precisions and compares the mean proportion recalled by individuals, nominal groups and collaborative groups.
+    #both sweeps use the same random numbers, so float32 only changes a draw whose uniform number lands within
+    #rounding of a boundary between two items' weights. With the default parameters 300 runs of 40 items (3 members)
+    #agreed exactly. returns the largest difference and whether it is within tolerance
+    means = []
+    for dtype in [np.float64, np.float32]:
+        individual, results, records, counters = run_chunk(RunTask(np.random.SeedSequence(seed).entropy, range(numruns), range(numruns),
+                                                                   list_length, group_size, dtype = dtype))
+        means.append([np.mean(individual), np.mean([r[0] for r in results]), np.mean([r[1] for r in results])])
+
+    difference = np.max(np.abs(np.subtract(means[0], means[1])))/list_length
+    print('float64: ', np.divide(means[0], list_length), '\nfloat32: ', np.divide(means[1], list_length))
+    print('largest difference: ', difference, 'within tolerance: ', difference <= tolerance)
+
+    return difference, difference <= tolerance
 
 def main():
     run_group_recall(100, 40, 3)
@@ -0,0 +1,139 @@
+#SAM_Sparse
+"""
+Sparse word associations for the uncategorized model.
+
+Without starting word associations almost every pair of items never shares the
+buffer and keeps the residual strength sam_d. SparseAssoc stores such a word
+association matrix as that baseline plus the entries that differ, which takes
+memory in proportion to ListLength*r instead of ListLength**2. The categorized
+model starts from category similarities between every pair, so only the
+uncategorized model can store its associations this way.
+"""
+import os
+import sys
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #SAM_Common sits next to the model folders
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+import numpy as np
+from SAM_Common.SAM_Encoding import buffer_residence, draw_presentation, repeated_add
+
+
+def encode_sparse_items(ListLength, t, r, sam_a, sam_b, sam_c, sam_d, rng, dtype = float):
+    #encode a single study list as SAM_Encoding.encode_items does, returns word_assoc as a SparseAssoc
+
+    present_order, evictions = draw_presentation(ListLength, r, rng)
+
+    return build_sparse_associations(present_order, evictions, t, r, sam_a, sam_b, sam_c, sam_d, dtype)
+
+
+def build_sparse_associations(present_order, evictions, t, r, sam_a, sam_b, sam_c, sam_d, dtype=float):
+    ''' present_order, evictions = (ListLength,) draws from draw_presentation for one model
+    t, r, sam_a, sam_b, sam_c, sam_d = encoding parameters of the SAM model
+    dtype = float type of context_assoc and of the dense rows word_assoc hands out
+
+    returns context_assoc (ListLength,) and word_assoc as a SparseAssoc, with the same values
+    build_associations gives for zero starting word associations
+    '''
+
+    ListLength = len(present_order)
+    t = int(t)
+
+    enter, leave = buffer_residence(present_order[None], evictions[None], r)
+    leave = leave[0][present_order] #step at which the item presented at each position left the buffer
+
+    #the item presented at position p shares the buffer with the items presented at positions p up to
+    #its leaving step, for min(leave[p], leave[q]) - q steps
+    stay = leave - np.arange(ListLength)
+    first = np.repeat(np.arange(ListLength), stay)
+    second = first + np.arange(stay.sum()) - np.repeat(np.cumsum(stay) - stay, stay)
+    counts = t*(np.minimum(leave[first], leave[second]) - second)
+
+    values = np.full(len(counts), float(sam_d))
+    if t > 0 and ListLength > 0: #the first item's association with itself starts from zero, as in build_associations
+        values[0] = 0.0
+    values = repeated_add(values, counts, np.where(first == second, float(sam_c), float(sam_b)))
+
+    word_assoc = SparseAssoc(ListLength, sam_d, dtype)
+    for p, q, count, value in zip(present_order[first], present_order[second], counts, values):
+        if count > 0:
+            word_assoc[p, q] = value
+            word_assoc[q, p] = value
+
+    context_assoc = np.zeros(ListLength)
+    context_assoc[present_order] = sam_a*(t*stay)
+
+    return context_assoc.astype(dtype), word_assoc
+
+
+class SparseAssoc:
+
+    def __init__(self, n, baseline, dtype = float):
+        ''' n = number of items
+        baseline = association strength of every pair without an entry of its own
+        dtype = float type of the dense rows handed out, entries are kept as Python floats
+
+        n x n association matrix stored as a baseline plus one dict of entries per row.
+        m[i, j] reads and writes single entries and m[i] gives a SparseRow, so m[i][j] works as
+        for a numpy matrix. Rows and the whole matrix turn into dense numpy arrays through np.asarray.
+        '''
+
+        self.n = n
+        self.baseline = float(baseline)
+        self.entries = [{} for i in range(n)]
+        self.shape = (n, n)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.entries[key[0]].get(key[1], self.baseline)
+
+        return SparseRow(self, key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            self.entries[key[0]][int(key[1])] = float(value)
+
+        elif key == slice(None): #m[:] = dense copies a dense matrix in, e.g. after batched recall
+            value = np.asarray(value, dtype = self.dtype)
+            for i in range(self.n):
+                cols = np.flatnonzero(value[i] != self.baseline)
+                self.entries[i] = dict(zip(cols.tolist(), value[i, cols].tolist()))
+
+        else:
+            raise TypeError('SparseAssoc entries are set with m[i, j] or m[i][j]')
+
+    def row(self, i):
+        #dense copy of row i
+
+        dense = np.full(self.n, self.baseline, dtype = self.dtype)
+        if self.entries[i]:
+            dense[list(self.entries[i])] = list(self.entries[i].values())
+
+        return dense
+
+    def __array__(self, dtype = None, copy = None):
+        return np.array([self.row(i) for i in range(self.n)], dtype = dtype or self.dtype).reshape(self.n, self.n)
+
+
+class SparseRow:
+
+    def __init__(self, matrix, i):
+        #row i of a SparseAssoc, reads and writes go to the matrix
+
+        self.matrix = matrix
+        self.i = i
+
+    def __len__(self):
+        return self.matrix.n
+
+    def __getitem__(self, j):
+        return self.matrix.entries[self.i].get(j, self.matrix.baseline)
+
+    def __setitem__(self, j, value):
+        self.matrix.entries[self.i][int(j)] = float(value)
+
+    def __array__(self, dtype = None, copy = None):
+        return self.matrix.row(self.i).astype(dtype) if dtype is not None else self.matrix.row(self.i)
@@ -0,0 +1,63 @@
+#test_checkpoint
+"""
+Checks of checkpointed sweeps, run with pytest from this folder: blocks of
+checkpoint_runs runs are run as parts of at most chunksize runs, spread over
+worker processes and kept within the memory cap of SAM_Sweep.block_runs, and a
+checkpointed sweep gives the same results as one without a checkpoint, also
+when it is resumed with other n_jobs and chunksize.
+"""
+import json
+from GroupRecall import run_group_recall, run_chunk, RunTask
+from SAM_Common import SAM_Sweep
+from SAM_Common.SAM_Sweep import SweepConfig, run_sweep
+
+
+def checkpoint_blocks(path):
+    #(start, runs) of every block in a checkpoint file
+    entries = [json.loads(line) for line in open(path).read().splitlines()[1:]]
+    return [(entry['start'], len(entry['results'])) for entry in entries]
+
+
+def test_parallel_checkpoint_matches_sweep(tmp_path):
+    path = str(tmp_path/'sweep.ckpt')
+    expected = run_group_recall(45, 20, 3, seed = 3).as_dict()
+
+    result = run_group_recall(45, 20, 3, seed = 3, config = SweepConfig(n_jobs = 2, chunksize = 3, checkpoint = path,
+                                                                        checkpoint_runs = 10))
+
+    assert result.as_dict() == expected
+    assert checkpoint_blocks(path) == [(0, 10), (10, 10), (20, 10), (30, 10), (40, 5)]
+
+
+def test_resume_with_other_jobs_and_chunksize(tmp_path):
+    path = tmp_path/'sweep.ckpt'
+    expected = run_group_recall(40, 20, 3, seed = 4).as_dict()
+    run_group_recall(40, 20, 3, seed = 4, config = SweepConfig(n_jobs = 2, chunksize = 3, checkpoint = str(path),
+                                                               checkpoint_runs = 10))
+
+    lines = path.read_text().splitlines(True)
+    path.write_text(''.join(lines[:3])) #settings and the first two blocks
+
+    result = run_group_recall(40, 20, 3, config = SweepConfig(chunksize = 7, checkpoint = str(path), checkpoint_runs = 10))
+
+    assert result.as_dict() == expected
+    assert checkpoint_blocks(str(path)) == [(0, 10), (10, 10), (20, 10), (30, 10)]
+
+
+def test_checkpoint_blocks_stay_within_memory_cap(tmp_path, monkeypatch):
+    #with room for 3 runs of 7 models of 20 items, blocks of 10 runs are run in parts of at most 3 runs
+    monkeypatch.setattr(SAM_Sweep, 'BLOCK_ASSOCIATIONS', 3*7*20**2)
+    task = RunTask(None, None, None, 20, 3)
+    parts = []
+
+    def run_block(part):
+        parts.append((part.runs.start, len(part.runs)))
+        return run_chunk(part)
+
+    summary = run_sweep(run_block, task, 25, seed = 5, config = SweepConfig(checkpoint = str(tmp_path/'sweep.ckpt'),
+                                                                            checkpoint_runs = 10))
+
+    assert max(runs for start, runs in parts) == 3
+    assert [start for start, runs in parts] == [0, 3, 6, 9, 10, 13, 16, 19, 20, 23]
+    assert checkpoint_blocks(str(tmp_path/'sweep.ckpt')) == [(0, 10), (10, 10), (20, 5)]
+    assert summary.as_dict() == run_sweep(run_chunk, task, 25, seed = 5).as_dict()
@@ -0,0 +1,75 @@
+#test_clock
+"""
+Checks of the simulated race clocks, run with pytest from this folder: the
+clocks' attempt costs, and the tie-breaking of GroupRecall.break_ties, which
+orders attempts at the same simulated time by a uniform each tied member draws
+from its own stream, so that no member of a group is favoured.
+"""
+import numpy as np
+import pytest
+from scipy import stats
+from GroupRecall import break_ties, count_late_fails, group_recall
+from SAM_Common.SAM_Clock import FixedClock, ExponentialClock
+from SAM_Common.SAM_Sampling import UniformStream
+from SAM_Group_Uncategorized import SAM_Group_Uncategorized
+
+
+class Member:
+    #stands in for a group member in break_ties, handing out the given uniforms
+    def __init__(self, *uniforms):
+        self.drawn = list(uniforms)
+        self.uniforms = self
+
+    def random(self):
+        return self.drawn.pop(0)
+
+
+def test_clock_costs():
+    u = np.random.default_rng(0).random(5)
+
+    assert FixedClock(2.5).attempt(None) == 2.5
+    assert np.array_equal(FixedClock(2.5).times(u), np.full(5, 2.5))
+    assert np.array_equal(ExponentialClock(2.0).times(u), -2.0*np.log1p(-u))
+
+    stream, rng = UniformStream(np.random.default_rng(1)), np.random.default_rng(1)
+    assert ExponentialClock(2.0).attempt(stream) == -2.0*np.log1p(-rng.random())
+    assert ExponentialClock(2.0).times(np.random.default_rng(2).random(20000)).mean() == pytest.approx(2.0, rel = .03)
+
+
+def test_break_ties_by_priority():
+    #members 0 and 1 respond at time 2, member 2 failed at time 2 and member 3 is not tied
+    group = [Member(.7), Member(.2), Member(.1), Member()]
+    times, fails = [2, 2, float('inf'), 4], [[1], [1], [1, 2], [2.5]]
+
+    winner, priority = break_ties(group, times, fails, 2, range(4))
+
+    assert winner == 1 #lowest priority among the members that responded, member 2 only failed
+    assert priority == {0: .7, 1: .2, 2: .1}
+    assert [len(g.drawn) for g in group] == [0, 0, 0, 0]
+
+
+def test_no_tie_draws_nothing():
+    group = [Member(.5), Member(.5)]
+
+    assert break_ties(group, [1, 3], [[], [1.5]], 1, range(2)) == (0, {})
+    assert [len(g.drawn) for g in group] == [1, 1]
+
+
+def test_count_late_fails():
+    #failures after the response count, a failure at the response time counts if its priority is above the winner's
+    fails = [1, 2, 2, 3]
+
+    assert count_late_fails(fails, 2, {}, 1, 0) == 1
+    assert count_late_fails(fails, 2, {0: .4, 1: .6}, 1, 0) == 3
+    assert count_late_fails(fails, 2, {0: .4, 1: .3}, 1, 0) == 1
+
+
+def test_fixed_clock_favours_no_member():
+    #with every attempt costing the same, many responses tie, each member position should still win a third of them
+    wins = np.zeros(3)
+    for seed in range(200):
+        winners = []
+        group_recall(SAM_Group_Uncategorized.batch(3, 20, rng = seed, clock = FixedClock()), winners = winners)
+        wins += np.bincount(winners, minlength = 3)
+
+    assert stats.chisquare(wins).pvalue > 1e-3
@@ -0,0 +1,171 @@
+#test_equivalence
+"""
+Equivalence checks for the fast paths of the model, run with pytest from this folder.
+
+Each fast path draws the same random numbers as the code it replaces, so the
+checks compare exact results: the vectorized encoding against the original
+buffer loop, batch_free_recall against free_recall one model at a time, the
+stacked GroupRace against the member by member race and sparse word
+associations against dense ones.
+"""
+import itertools
+import numpy as np
+import pytest
+from GroupRecall import group_recall
+from SAM_Common.SAM_Batch import batch_free_recall, batch_group_recall, inverse_cdf
+from SAM_Common.SAM_Clock import ExponentialClock
+from SAM_Common.SAM_Encoding import build_associations, draw_presentation
+from SAM_Common.SAM_Sampling import WordCueSampler
+from SAM_Sparse import build_sparse_associations
+from SAM_Group_Uncategorized import SAM_Group_Uncategorized
+from SAM_Nominal_Uncategorized import SAM_Nominal_Uncategorized
+
+
+def loop_encoding(present_order, evictions, t, r, sam_a, sam_b, sam_c, sam_d, word_assoc = None):
+    #the encoding loop the models used before SAM_Encoding, with the presentation order and buffer
+    #evictions given instead of drawn
+
+    ListLength = len(present_order)
+    buffer = []
+    word_assoc = np.zeros((ListLength, ListLength)) if word_assoc is None else np.array(word_assoc, dtype = float)
+    loops_inbuffer = [0]*ListLength
+
+    for i in range(ListLength):
+        if i >= r:
+            buffer[evictions[i]] = present_order[i]
+        else:
+            buffer.append(present_order[i])
+
+        to_update = list(itertools.permutations(buffer, 2))
+
+        for k in range(t):
+            for pair in to_update:
+                word_assoc[pair[0]][pair[1]] = word_assoc[pair[0]][pair[1]] + sam_b
+            for j in range(len(buffer)):
+                word_assoc[buffer[j]][buffer[j]] = word_assoc[buffer[j]][buffer[j]] + sam_c
+            for j in buffer:
+                loops_inbuffer[j] += 1
+
+        word_assoc[word_assoc == 0] = sam_d
+
+    context_assoc = np.array([sam_a*loops for loops in loops_inbuffer])
+
+    return context_assoc, word_assoc
+
+
+@pytest.mark.parametrize('ListLength, t, r', [(12, 2, 4), (30, 3, 4), (20, 1, 6), (3, 2, 4), (15, 0, 4)])
+@pytest.mark.parametrize('start', [False, True])
+def test_build_associations_matches_loop(ListLength, t, r, start):
+    #bit-identical to the loop, with zero starting word associations (uncategorized) and with starting
+    #similarities that are partly zero (categorized)
+    rng = np.random.default_rng(ListLength*10 + t)
+    params = (t, r, .08, .07, .09, .02)
+
+    for m in range(5):
+        present_order, evictions = draw_presentation(ListLength, r, rng)
+        initial = np.where(rng.random((ListLength, ListLength)) < .5, 0, rng.random((ListLength, ListLength))) if start else None
+
+        expected = loop_encoding(present_order, evictions, *params, word_assoc = initial)
+        context_assoc, word_assoc = build_associations(present_order[None], evictions[None], *params,
+                                                       word_assoc = None if initial is None else initial[None])
+
+        assert np.array_equal(context_assoc[0], expected[0])
+        assert np.array_equal(word_assoc[0], expected[1])
+
+
+@pytest.mark.parametrize('ListLength, t, r', [(12, 2, 4), (30, 3, 4), (3, 2, 4)])
+def test_sparse_associations_match_dense(ListLength, t, r):
+    rng = np.random.default_rng(ListLength)
+    params = (t, r, .08, .07, .09, .02)
+
+    for m in range(5):
+        present_order, evictions = draw_presentation(ListLength, r, rng)
+        dense = build_associations(present_order[None], evictions[None], *params)
+        context_assoc, word_assoc = build_sparse_associations(present_order, evictions, *params)
+
+        assert np.array_equal(context_assoc, dense[0][0])
+        assert np.array_equal(np.asarray(word_assoc), dense[1][0])
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_batch_free_recall_matches_free_recall(sparse):
+    for seed in range(20):
+        batch = batch_free_recall(SAM_Nominal_Uncategorized.batch(6, 30, rng = seed, sparse = sparse), block_size = 4, batch_size = 0)
+        serial = [g.free_recall() for g in SAM_Nominal_Uncategorized.batch(6, 30, rng = seed, sparse = sparse)]
+
+        assert [list(map(int, r)) for r in batch] == [list(map(int, r)) for r in serial]
+
+
+def test_batch_free_recall_matches_free_recall_long_run():
+    #long study lists and recalls, every word cue row is built again after many association updates
+    params = dict(Kmax = 400, Lmax = 40, sam_e = 1.3, sam_f = 1.7, sam_g = .9)
+    for seed in range(10):
+        batch = batch_free_recall(SAM_Nominal_Uncategorized.batch(5, 150, rng = seed, **params), batch_size = 0, batch_length = 150)
+        serial = [g.free_recall() for g in SAM_Nominal_Uncategorized.batch(5, 150, rng = seed, **params)]
+
+        assert [list(map(int, r)) for r in batch] == [list(map(int, r)) for r in serial]
+
+
+def test_wordcue_sampler_matches_inverse_cdf():
+    #draws on the boundary between two items after thousands of updates and exclusions, where a cumulative sum
+    #that drifted from a fresh np.cumsum by a rounding error would pick the neighbouring item
+    rng = np.random.default_rng(0)
+    context_assoc, word_assoc = rng.random(80), rng.random((80, 80))
+    excluded = np.zeros(80, dtype = bool)
+    sampler = WordCueSampler(context_assoc, word_assoc)
+    cue = 0
+
+    for step in range(5000):
+        if rng.random() < .3:
+            cue = int(rng.integers(80))
+        weights = context_assoc*word_assoc[cue]
+        weights[excluded] = 0
+        cumulative = np.cumsum(weights)
+        u = cumulative[rng.integers(80)]/cumulative[-1]
+
+        assert sampler.sample(cue, u) == inverse_cdf(weights[None], np.array([u]))[0]
+
+        item = int(rng.integers(80))
+        if rng.random() < .01:
+            excluded[item] = True
+            sampler.exclude(item)
+        elif rng.random() < .5:
+            context_assoc[item] += .7
+            word_assoc[item, item] += .5
+            word_assoc[cue, item] += .3
+            word_assoc[item, cue] += .3
+            sampler.update(item, cue, .7)
+
+
+def test_sparse_free_recall_matches_dense():
+    for seed in range(20):
+        dense = [g.free_recall() for g in SAM_Nominal_Uncategorized.batch(3, 30, rng = seed)]
+        sparse = [g.free_recall() for g in SAM_Nominal_Uncategorized.batch(3, 30, rng = seed, sparse = True)]
+
+        assert [list(map(int, r)) for r in dense] == [list(map(int, r)) for r in sparse]
+
+
+@pytest.mark.parametrize('clock', [None, ExponentialClock()])
+@pytest.mark.parametrize('exclude_recalled', [False, True])
+@pytest.mark.parametrize('group_size', [2, 5])
+def test_group_race_matches_member_loop(clock, exclude_recalled, group_size):
+    #same responses, winners, final K and associations, also with the ties of the default FixedClock
+    for seed in range(15):
+        loop_group = SAM_Group_Uncategorized.batch(group_size, 30, rng = seed, clock = clock, exclude_recalled = exclude_recalled)
+        race_group = SAM_Group_Uncategorized.batch(group_size, 30, rng = seed, clock = clock, exclude_recalled = exclude_recalled)
+        loop_winners, race_winners = [], []
+
+        assert group_recall(loop_group, race_size = 10**9, winners = loop_winners) == batch_group_recall(race_group, winners = race_winners)
+        assert loop_winners == race_winners
+        assert [g.K for g in loop_group] == [g.K for g in race_group]
+        for a, b in zip(loop_group, race_group):
+            assert np.array_equal(a.word_assoc, b.word_assoc)
+            assert np.array_equal(a.context_assoc, b.context_assoc)
+
+
+def test_sparse_group_recall_matches_dense():
+    for seed in range(15):
+        dense = group_recall(SAM_Group_Uncategorized.batch(3, 30, rng = seed))
+        sparse = group_recall(SAM_Group_Uncategorized.batch(3, 30, rng = seed, sparse = True))
+
+        assert dense == sparse
@@ -0,0 +1,76 @@
+#test_fit
+"""
+Checks of SAM_Common.SAM_Fit, run with pytest from this folder: the loss and
+its standard error, the race of trials in stages, which stops a trial clearly
+worse than its reference and runs the rest in full, and the search on a
+measure with a known best parameter.
+"""
+import numpy as np
+import pytest
+from GroupRecall import fit_parameters
+from SAM_Common.SAM_Fit import loss, race, fit
+from SAM_Common.SAM_Stats import RunningStats
+
+
+def noisy(x, first, last):
+    #measures of runs first to last of a candidate with parameter x, run r draws its noise from seed r
+    #(common random numbers)
+    values = [x + .1*np.random.default_rng(r).standard_normal() for r in range(first, last)]
+    return {'m': RunningStats.of(values)}
+
+
+def evaluate_cells(calls):
+    def evaluate(cells, first, last):
+        calls.append(([cell['x'] for cell in cells], first, last))
+        return [noisy(cell['x'], first, last) for cell in cells]
+    return evaluate
+
+
+def test_loss():
+    values = np.array([.2, .4, .3, .5])
+    measures = {'m': RunningStats.of(values), 'n': RunningStats.of([1.0, 1.0])}
+    sem2 = values.var(ddof = 1)/4
+
+    value, se = loss(measures, {'m': .1, 'n': 1.0}, weights = {'m': 2})
+    assert value == pytest.approx(2*(values.mean() - .1)**2)
+    assert se == pytest.approx(np.sqrt((4*(values.mean() - .1))**2*sem2))
+    assert loss(measures, {'m': .1}, unbiased = True)[0] == pytest.approx((values.mean() - .1)**2 - sem2)
+    assert loss({'m': RunningStats()}, {'m': .1}) == (np.inf, 0.0)
+
+
+def test_race_without_references_runs_every_stage():
+    calls = []
+    scores = race([{'x': .1}, {'x': .9}], evaluate_cells(calls), {'m': 0}, [4, 8, 16])
+
+    assert calls == [([.1, .9], 0, 4), ([.1, .9], 4, 8), ([.1, .9], 8, 16)]
+    assert [score[3] for score in scores] == [16, 16]
+    #measures merged over the stages are those of all runs at once
+    assert scores[0][:2] == pytest.approx(loss(noisy(.1, 0, 16), {'m': 0}))
+
+
+def test_race_stops_trials_clearly_worse_than_reference():
+    #against a reference loss of .01, x = .9 (loss about .8) stops after the first stage, x = .1 (about .01) and
+    #x = .05 run in full
+    calls = []
+    scores = race([{'x': .9}, {'x': .1}, {'x': .05}], evaluate_cells(calls), {'m': 0}, [4, 8, 16], references = [.01]*3)
+
+    assert calls == [([.9, .1, .05], 0, 4), ([.1, .05], 4, 8), ([.1, .05], 8, 16)]
+    assert [score[3] for score in scores] == [4, 16, 16]
+    assert scores[0][0] == pytest.approx(loss(noisy(.9, 0, 4), {'m': 0})[0])
+
+
+def test_fit_finds_best_parameter():
+    calls = []
+    result = fit({'x': (0.0, 1.0)}, evaluate_cells(calls), {'m': .3}, [4, 16], population = 6, generations = 15, seed = 0)
+
+    assert result['params']['x'] == pytest.approx(.3, abs = .05)
+    assert result['runs'] == sum(len(cells)*(last - first) for cells, first, last in calls)
+    assert result['runs'] < 6*16*16 #some trials were stopped early
+
+
+def test_fit_parameters_same_with_processes():
+    #candidates run on common random numbers from the seed, so the search does not depend on how runs are spread
+    args = dict(targets = {'nominal': .6, 'collaborative': .5}, bounds = {'sam_e': (.5, 1.0)}, numruns = 8,
+                list_length = 20, seed = 1, population = 4, generations = 2)
+
+    assert fit_parameters(n_jobs = 1, **args) == fit_parameters(n_jobs = 2, **args)
@@ -0,0 +1,37 @@
+#test_parallel
+"""
+Checks that sweeps give the same results however they are run, with pytest from
+this folder: statistics, stored records and parameter sweep cells of runs spread
+over worker processes in blocks of any size are identical, to the last bit, to
+those of the same sweep run serially.
+"""
+import pytest
+from GroupRecall import run_group_recall, run_parameter_sweep
+from SAM_Common.SAM_Store import load_results
+from SAM_Common.SAM_Sweep import SweepConfig, grid_design
+
+
+@pytest.mark.parametrize('chunksize', [None, 1, 7])
+@pytest.mark.parametrize('paired', [False, True])
+def test_parallel_sweep_matches_serial(chunksize, paired):
+    serial = run_group_recall(30, 20, 3, seed = 11, paired = paired)
+    parallel = run_group_recall(30, 20, 3, seed = 11, paired = paired, config = SweepConfig(n_jobs = 2, chunksize = chunksize))
+
+    assert parallel.as_dict(paired = paired) == serial.as_dict(paired = paired)
+
+
+def test_parallel_records_match_serial(tmp_path):
+    run_group_recall(25, 20, 3, seed = 12, config = SweepConfig(store = str(tmp_path/'serial'), store_chunk = 10))
+    run_group_recall(25, 20, 3, seed = 12, config = SweepConfig(n_jobs = 2, chunksize = 4, store = str(tmp_path/'parallel'),
+                                                                store_chunk = 10))
+
+    assert load_results(str(tmp_path/'parallel'))[1:] == load_results(str(tmp_path/'serial'))[1:]
+
+
+def test_parallel_parameter_sweep_matches_serial():
+    design = grid_design({'group_size': [2, 3], 'Kmax': [15, 30]})
+
+    serial = run_parameter_sweep(design, 12, list_length = 20, seed = 13, n_jobs = 1)
+    parallel = run_parameter_sweep(design, 12, list_length = 20, seed = 13, n_jobs = 2, chunksize = 5)
+
+    assert parallel == serial
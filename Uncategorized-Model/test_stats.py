@@ -0,0 +1,108 @@
+#test_stats
+"""
+Checks of SAM_Common.SAM_Stats, run with pytest from this folder: the running
+statistics and t-tests against numpy and scipy.stats on the same values, and
+Reservoir merges against a uniform sample of both streams.
+"""
+import numpy as np
+import os
+import pytest
+import sys
+from scipy import stats
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #SAM_Common sits next to the model folders
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from SAM_Common.SAM_Stats import RunningStats, Reservoir, SweepSummary, ttest_ind, ttest_rel
+
+
+def blocks(values, sizes):
+    #RunningStats of consecutive blocks of values, merged
+    s, start = RunningStats(), 0
+    for size in sizes:
+        s.merge(RunningStats.of(values[start:start + size]))
+        start += size
+    return s
+
+
+def test_running_stats_match_numpy():
+    values = np.random.default_rng(0).integers(0, 40, size = 500).astype(float)
+    added = RunningStats()
+    for x in values:
+        added.add(x)
+
+    for s in [added, RunningStats.of(values), blocks(values, [1, 99, 0, 250, 150])]:
+        assert s.count == values.size
+        assert s.mean == pytest.approx(values.mean(), rel = 1e-12)
+        assert s.var(1) == pytest.approx(values.var(ddof = 1), rel = 1e-12)
+        assert s.sem() == pytest.approx(stats.sem(values), rel = 1e-12)
+
+
+@pytest.mark.parametrize('n, m', [(50, 50), (30, 200), (2, 3)])
+def test_ttest_ind_matches_scipy(n, m):
+    rng = np.random.default_rng(n*m)
+    a, b = rng.integers(5, 25, size = n).astype(float), rng.integers(3, 22, size = m).astype(float)
+
+    result = ttest_ind(blocks(a, [n//2, n - n//2]), RunningStats.of(b))
+    expected = stats.ttest_ind(a, b)
+
+    assert result.statistic == pytest.approx(expected.statistic, rel = 1e-10)
+    assert result.pvalue == pytest.approx(expected.pvalue, rel = 1e-8)
+    assert result.df == n + m - 2
+
+
+@pytest.mark.parametrize('n', [3, 40, 400])
+def test_ttest_rel_matches_scipy(n):
+    rng = np.random.default_rng(n)
+    a, b = rng.integers(5, 25, size = n).astype(float), rng.integers(3, 22, size = n).astype(float)
+
+    result = ttest_rel(RunningStats.of(a - b))
+    expected = stats.ttest_rel(a, b)
+
+    assert result.statistic == pytest.approx(expected.statistic, rel = 1e-10)
+    assert result.pvalue == pytest.approx(expected.pvalue, rel = 1e-8)
+    assert result.df == n - 1
+
+
+def test_sweep_summary_ttest_matches_scipy():
+    rng = np.random.default_rng(1)
+    nominal, collaborative = rng.integers(10, 30, size = 300), rng.integers(8, 28, size = 300)
+    summary = SweepSummary()
+    summary.add_block(0, [], list(zip(nominal, collaborative)))
+
+    assert summary.ttest().pvalue == pytest.approx(stats.ttest_ind(nominal, collaborative).pvalue, rel = 1e-8)
+    assert summary.ttest(paired = True).pvalue == pytest.approx(stats.ttest_rel(nominal, collaborative).pvalue, rel = 1e-8)
+
+
+def test_reservoir_merge_keeps_everything_below_size():
+    a, b = Reservoir(10, rng = 0), Reservoir(10, rng = 1)
+    for x in range(4):
+        a.add(x)
+    for x in range(4, 7):
+        b.add(x)
+
+    a.merge(b)
+
+    assert sorted(a.sample) == list(range(7))
+    assert a.count == 7
+
+
+def test_reservoir_merge_is_uniform():
+    #values 0-29 go to one reservoir and 30-119 to another, every value should be in the merged sample of 10
+    #with probability 10/120 whichever stream it came from
+    size, trials = 10, 3000
+    kept = np.zeros(120)
+
+    for trial in range(trials):
+        a, b = Reservoir(size, rng = 2*trial), Reservoir(size, rng = 2*trial + 1)
+        for x in range(30):
+            a.add(x)
+        for x in range(30, 120):
+            b.add(x)
+        a.merge(b)
+
+        assert len(a.sample) == size and len(set(a.sample)) == size
+        assert a.count == 120
+        kept[a.sample] += 1
+
+    assert kept[:30].sum()/(size*trials) == pytest.approx(30/120, abs = .01)
+    assert stats.chisquare(kept).pvalue > 1e-3
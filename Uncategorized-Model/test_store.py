@@ -0,0 +1,67 @@
+#test_store
+"""
+Checks of SAM_Common.SAM_Store, run with pytest from this folder: records read
+back from a ResultStore as they were added, a Checkpoint read back as it was
+saved, and a stored, checkpointed sweep resumed after its checkpoint was cut
+short giving the same statistics and records as an uninterrupted sweep.
+"""
+import json
+import pytest
+from GroupRecall import run_group_recall
+from SAM_Common.SAM_Store import ResultStore, Checkpoint, load_results
+from SAM_Common.SAM_Sweep import SweepConfig
+
+
+def test_result_store_round_trip(tmp_path):
+    runs = [(run, [[run, 1], [], [2, 3, 4]], [(run, 1), (2, 0), (3, 3)], [4, run, 0], [0, 2, 1], [(1, 1), (2, 2), (0, 3)])
+            for run in range(7)]
+    individual = [(i, list(range(i)), i, 3) for i in range(4)]
+
+    with ResultStore(str(tmp_path), 3, chunk_size = 3, meta = {'list_length': 20}) as store:
+        for record in individual:
+            store.add_individual(*record)
+        for record in runs:
+            store.add_run(*record)
+
+    meta, run_records, individual_records = load_results(str(tmp_path))
+
+    assert (meta['list_length'], meta['group_size'], meta['n_runs'], meta['n_individual']) == (20, 3, 7, 4)
+    assert [(r['run'], r['nominal'], list(zip(r['nominal_K'], r['nominal_L'])), r['collaborative'], r['winner'],
+             list(zip(r['collab_K'], r['collab_L']))) for r in run_records] == runs
+    assert [(r['run'], r['response'], r['K'], r['L']) for r in individual_records] == individual
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path/'sweep.ckpt')
+    checkpoint = Checkpoint(path)
+    checkpoint.begin({'seed': 5, 'list_length': 20})
+    checkpoint.save(0, [10, 12], [[15, 13], [14, 14]])
+    checkpoint.save(2, [11], [[16, 12]])
+
+    restored = Checkpoint(path)
+    restored.begin({'seed': 5, 'list_length': 20})
+
+    assert restored.settings == {'seed': 5, 'list_length': 20}
+    assert restored.done == {0: [[10, 12], [[15, 13], [14, 14]]], 2: [[11], [[16, 12]]]}
+    with pytest.raises(ValueError):
+        Checkpoint(path).begin({'seed': 5, 'list_length': 30})
+
+
+def test_resume_after_truncated_checkpoint(tmp_path):
+    def sweep(name, seed = 7):
+        config = SweepConfig(store = str(tmp_path/name), store_chunk = 5, checkpoint = str(tmp_path/(name + '.ckpt')),
+                             checkpoint_runs = 10)
+        return run_group_recall(40, 20, 3, seed = seed, config = config).as_dict()
+
+    expected = sweep('whole')
+    sweep('stopped')
+
+    #keep the settings and two finished blocks, and half of the third block's line as a crash would leave it
+    path = tmp_path/'stopped.ckpt'
+    lines = path.read_text().splitlines(True)
+    path.write_text(''.join(lines[:3]) + lines[3][:len(lines[3])//2])
+    assert len(Checkpoint(str(path)).done) == 2
+
+    assert sweep('stopped', seed = None) == expected
+    assert load_results(str(tmp_path/'stopped'))[1:] == load_results(str(tmp_path/'whole'))[1:]
+    assert [json.loads(line)['start'] for line in path.read_text().splitlines()[1:]] == [0, 10, 20, 30]